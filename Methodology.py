@@ -14,7 +14,7 @@ This flowchart for the AI chatbot methodology includes several key steps that en
    Once the appropriate agent is selected, the chatbot retrieves relevant information, such as specific school details or PSLE scores. The chatbot may pull data from various sources, including the Ministry of Education’s PSLE resources or the Open Data API.  
    
    - **PSLE Score Explanation Scraping**  
-     For queries related to PSLE scores, the chatbot uses **PyMuPDF** to extract specific explanations from the Ministry of Education’s PSLE informational PDF. By accessing this PDF, the chatbot retrieves official explanations on PSLE scoring, offering users accurate information directly from the source.
+     For queries related to PSLE scores, the chatbot uses **PyMuPDF** to extract specific explanations from the Ministry of Education’s PSLE informational PDF. The PDF is extracted, chunked and indexed once when the app is built, so the chatbot retrieves official explanations on PSLE scoring from a local index, offering users accurate information directly from the source.
 
 3. **Response Display**  
    The chatbot presents the retrieved information or advice to the user. This response could include details like PSLE scoring information, school programs, or recommendations based on personal interests and logistical factors.
@@ -0,0 +1,276 @@
+"""HTTP API over the chatbot core, for counsellors' batch tools and the Streamlit app.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+POST /v1/turns   {"prompt": "...", "memory": {...} or null, "stream": true}
+    Streams the core's events as newline-delimited JSON, ending with an "end"
+    event that carries the updated memory to send with the next turn. With
+    "stream": false the reply is one JSON object with response_type, messages
+    and memory. The server keeps no conversation state, so any worker or
+    replica can take any turn.
+POST /v1/route   {"prompts": ["...", ...]}  ->  {"response_types": [...]}
+POST /v1/shortlist  {"profile": {"al_score": 14, "postal_code": "...", "ccas": [...], "notes": "..."},
+                     "schools": ["...", ...]}
+    Compares a student's shortlisted schools, see shortlist.build_shortlist_report.
+GET  /healthz    readiness and worker pool usage
+GET  /metrics    span metrics in Prometheus text format
+
+Turns run on a bounded thread pool (AGENT_API_WORKERS per process); requests
+beyond that wait for a free worker, up to AGENT_API_QUEUE_LIMIT, and are then
+turned away with 503. Run one server process per cache directory: the ChromaDB
+store cannot be shared between processes and the metrics file holds one
+process's counters. Scale with AGENT_API_WORKERS, or run further replicas with
+their own SCHOOL_FINDER_CACHE_DIR. Set AGENT_API_TOKEN to require a bearer token, and
+AGENT_API_MEMORY_KEY (shared by every replica) to sign the memory handed to
+clients, so a turn only accepts memory the server produced. Other
+settings are read from upper-cased environment variables, see core.DEFAULT_SETTINGS.
+"""
+import sys
+import pysqlite3
+sys.modules['sqlite3'] = pysqlite3
+
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import core
+from memory import MemoryStateError
+from shortlist import ShortlistError, build_shortlist_report
+from resources import startup_report
+from tracing import metrics
+
+API_WORKERS = int(os.environ.get("AGENT_API_WORKERS", 8))
+API_QUEUE_LIMIT = int(os.environ.get("AGENT_API_QUEUE_LIMIT", 32))
+API_TOKEN = os.environ.get("AGENT_API_TOKEN")
+MEMORY_KEY = os.environ.get("AGENT_API_MEMORY_KEY")
+MAX_PROMPT_CHARS = 2000
+MAX_ROUTE_BATCH = 500
+
+core.configure(core.settings_from_environment())
+turn_pool = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="turn")
+# Turns admitted to the pool or waiting for it; counted on the event loop thread only
+_admitted = 0
+
+
+class Overloaded(Exception):
+    pass
+
+
+def _admit():
+    global _admitted
+    if _admitted >= API_WORKERS + API_QUEUE_LIMIT:
+        raise Overloaded()
+    _admitted += 1
+
+
+def _release():
+    global _admitted
+    _admitted -= 1
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response that gives back its admission slot however it ends.
+
+    The slot is released here rather than in the body generator, which never
+    starts when the client is gone before the response headers are sent.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Stop the turn (if it started) before freeing its slot
+            await self.body_iterator.aclose()
+            _release()
+
+
+# Function to run a blocking event generator on the worker pool and hand its events to the event loop
+async def iterate_in_pool(make_events):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    finished = object()
+    cancelled = threading.Event()
+
+    def produce():
+        events = make_events()
+        try:
+            for event in events:
+                if cancelled.is_set():
+                    break  # The client went away, stop generating
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as e:
+            print(f"Error answering turn: {e}")
+            loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "error": type(e).__name__})
+        finally:
+            events.close()
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    # Each turn gets a fresh copy of the context so its tracing spans stay separate
+    worker = loop.run_in_executor(turn_pool, contextvars.copy_context().run, produce)
+    try:
+        while (event := await queue.get()) is not finished:
+            yield event
+    finally:
+        cancelled.set()
+        await worker
+
+
+def _authorised(request):
+    if not API_TOKEN:
+        return True
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return hmac.compare_digest(supplied, API_TOKEN)
+
+
+# Function to compute the signature of a memory state, over its canonical JSON form
+def _memory_signature(state):
+    payload = json.dumps({key: value for key, value in state.items() if key != "signature"},
+                         sort_keys=True, separators=(",", ":"))
+    return hmac.new(MEMORY_KEY.encode("utf-8"), payload.encode("utf-8"), "sha256").hexdigest()
+
+
+def _sign_memory(state):
+    return dict(state, signature=_memory_signature(state)) if MEMORY_KEY else state
+
+
+# Function to check a client's memory and cut it down to the memory budgets; raises MemoryStateError
+def _load_client_memory(state):
+    if state is None:
+        return None
+    if not isinstance(state, dict):
+        raise MemoryStateError("memory must be the object returned by the previous turn")
+    if MEMORY_KEY and not hmac.compare_digest(str(state.get("signature", "")), _memory_signature(state)):
+        raise MemoryStateError("memory was not returned by this server or has been changed")
+    return core.load_memory(state).to_dict()
+
+
+async def _read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+async def turns(request):
+    if not _authorised(request):
+        return JSONResponse({"error": "Unauthorised"}, status_code=401)
+    body = await _read_json(request)
+    prompt = (body or {}).get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip() or len(prompt) > MAX_PROMPT_CHARS:
+        return JSONResponse({"error": f"prompt must be a non-empty string of at most {MAX_PROMPT_CHARS} characters"},
+                            status_code=400)
+    try:
+        memory = _load_client_memory(body.get("memory"))
+    except MemoryStateError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        _admit()
+    except Overloaded:
+        return JSONResponse({"error": "All workers are busy, try again shortly"}, status_code=503,
+                            headers={"Retry-After": "1"})
+
+    if not body.get("stream", True):
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(turn_pool, contextvars.copy_context().run, core.answer, prompt, memory)
+        finally:
+            _release()
+        result["memory"] = _sign_memory(result["memory"])
+        return JSONResponse(result)
+
+    async def stream():
+        async for event in iterate_in_pool(lambda: core.run_turn(prompt, memory)):
+            if event["type"] == "end":
+                event = dict(event, memory=_sign_memory(event["memory"]))
+            yield json.dumps(event) + "\n"
+
+    return AdmittedStreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def route(request):
+    if not _authorised(request):
+        return JSONResponse({"error": "Unauthorised"}, status_code=401)
+    body = await _read_json(request)
+    prompts = (body or {}).get("prompts")
+    if not isinstance(prompts, list) or len(prompts) > MAX_ROUTE_BATCH or not all(isinstance(p, str) for p in prompts):
+        return JSONResponse({"error": f"prompts must be a list of at most {MAX_ROUTE_BATCH} strings"}, status_code=400)
+    # Routing may ask the LLM about ambiguous prompts, so a batch takes a worker like a turn
+    try:
+        _admit()
+    except Overloaded:
+        return JSONResponse({"error": "All workers are busy, try again shortly"}, status_code=503,
+                            headers={"Retry-After": "1"})
+    try:
+        loop = asyncio.get_running_loop()
+        response_types = await loop.run_in_executor(turn_pool, contextvars.copy_context().run,
+                                                    lambda: [core.get_response_type(p) for p in prompts])
+    finally:
+        _release()
+    return JSONResponse({"response_types": response_types})
+
+
+async def shortlist(request):
+    if not _authorised(request):
+        return JSONResponse({"error": "Unauthorised"}, status_code=401)
+    body = await _read_json(request)
+    profile = (body or {}).get("profile") or {}
+    schools = (body or {}).get("schools")
+    if not isinstance(profile, dict) or not isinstance(schools, list) or not all(isinstance(s, str) for s in schools):
+        return JSONResponse({"error": "profile must be an object and schools a list of school names"}, status_code=400)
+    try:
+        _admit()
+    except Overloaded:
+        return JSONResponse({"error": "All workers are busy, try again shortly"}, status_code=503,
+                            headers={"Retry-After": "1"})
+    try:
+        loop = asyncio.get_running_loop()
+        report = await loop.run_in_executor(turn_pool, contextvars.copy_context().run,
+                                            build_shortlist_report, profile, schools)
+    except ShortlistError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    finally:
+        _release()
+    return JSONResponse(report)
+
+
+async def healthz(request):
+    return JSONResponse({
+        "status": "ok",
+        "workers": API_WORKERS,
+        "turns_in_progress": _admitted,
+        "resources": {name: round(seconds, 3) for name, seconds in startup_report()},
+    })
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the local data and indexes before taking traffic, without blocking the event loop
+    await asyncio.get_running_loop().run_in_executor(turn_pool, core.warm_up)
+    yield
+    turn_pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route("/v1/turns", turns, methods=["POST"]),
+        Route("/v1/route", route, methods=["POST"]),
+        Route("/v1/shortlist", shortlist, methods=["POST"]),
+        Route("/healthz", healthz),
+        Route("/metrics", metrics_endpoint),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,195 @@
+"""Offline benchmark of the chatbot against the local stand-in servers.
+
+Drives streamlit_app.py headlessly through Streamlit's AppTest, replaying the
+prompt corpus in N concurrent sessions (one process each), and reports turn latency percentiles,
+model and HTTP calls per turn and throughput. Nothing leaves the machine:
+OpenAI, data.gov.sg and OneMap are all served by benchmarks/stub_servers.py.
+
+    python benchmarks/run_benchmark.py --sessions 4 --llm-latency 0.8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "streamlit_app.py")
+DEFAULT_PROMPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.txt")
+sys.path.insert(0, REPO_DIR)
+
+from stub_servers import StubServers, StubSettings  # noqa: E402
+
+
+def load_prompts(path):
+    with open(path, "r", encoding="utf-8") as prompts_file:
+        return [line.strip() for line in prompts_file if line.strip() and not line.startswith("#")]
+
+
+# Function to replay prompts in one headless app session, returning one result per turn
+def run_session(session_id, prompts, timeout, secrets):
+    from streamlit.testing.v1 import AppTest
+
+    install_secrets(secrets)
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    app.session_state["password_correct"] = True
+    app.run()
+    if app.exception or not app.chat_input:
+        raise RuntimeError(f"Session {session_id} failed to start: "
+                           + "; ".join(str(exception.message) for exception in app.exception))
+
+    turns = []
+    for prompt in prompts:
+        if not app.chat_input:
+            raise RuntimeError(f"Session {session_id} lost its chat input: "
+                               + "; ".join(str(exception.message) for exception in app.exception))
+        started_at = time.time()
+        started = time.perf_counter()
+        app.chat_input[0].set_value(prompt).run()
+        latency = time.perf_counter() - started
+        trace = app.session_state["last_trace"] if "last_trace" in app.session_state else {"spans": []}
+        spans = trace["spans"]
+        routing = next((recorded for recorded in spans if recorded["name"] == "routing"), {})
+        turns.append({
+            "session": session_id,
+            "prompt": prompt,
+            "path": routing.get("response_type", "none"),
+            "started_at": started_at,
+            "latency": latency,
+            "llm_calls": sum(1 for recorded in spans if recorded["name"].startswith("llm.")
+                             and not recorded.get("cache_hit")),
+            "cache_hits": sum(1 for recorded in spans if recorded.get("cache_hit")),
+            "http_calls": sum(1 for recorded in spans if recorded["name"].startswith("http.")),
+            "errors": [recorded["error"] for recorded in spans if recorded["error"]]
+                      + [str(exception.message) for exception in app.exception],
+        })
+    return turns
+
+
+# Function to set the app's secrets for the whole process instead of through AppTest.secrets,
+# which swaps st.secrets around every run
+def install_secrets(values):
+    import streamlit as st
+    from streamlit.runtime.secrets import Secrets
+
+    secrets = Secrets()
+    secrets._secrets = dict(values)
+    st.secrets = secrets
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1)}
+
+
+def summarise(turns, stub_counts):
+    # Measured from the first turn to the last, so session start-up is not counted
+    elapsed = max(turn["started_at"] + turn["latency"] for turn in turns) - min(turn["started_at"] for turn in turns) \
+        if turns else 0.0
+    by_path = {}
+    for turn in turns:
+        by_path.setdefault(turn["path"], []).append(turn)
+    return {
+        "turns": len(turns),
+        "wall_seconds": round(elapsed, 2),
+        "throughput_turns_per_second": round(len(turns) / elapsed, 3) if elapsed else None,
+        "latency_ms": percentiles([turn["latency"] for turn in turns]),
+        "latency_ms_by_path": {
+            path: dict(percentiles([turn["latency"] for turn in path_turns]), turns=len(path_turns))
+            for path, path_turns in sorted(by_path.items())
+        },
+        "llm_calls_per_turn": round(float(np.mean([turn["llm_calls"] for turn in turns])), 2) if turns else 0,
+        "http_calls_per_turn": round(float(np.mean([turn["http_calls"] for turn in turns])), 2) if turns else 0,
+        "response_cache_hits": sum(turn["cache_hits"] for turn in turns),
+        "turns_with_errors": sum(1 for turn in turns if turn["errors"]),
+        "stub_requests": stub_counts,
+    }
+
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(f"{report['turns']} turns in {report['wall_seconds']}s "
+          f"({report['throughput_turns_per_second']} turns/s)")
+    print(f"Turn latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+    for path, stats in report["latency_ms_by_path"].items():
+        print(f"  {path:<20} {stats['turns']:>4} turns  p50 {stats['p50']} ms  p95 {stats['p95']} ms  p99 {stats['p99']} ms")
+    print(f"Calls per turn: {report['llm_calls_per_turn']} model, {report['http_calls_per_turn']} HTTP; "
+          f"{report['response_cache_hits']} response cache hits")
+    print(f"Turns with errors: {report['turns_with_errors']}")
+    print("Stub requests: " + ", ".join(f"{route}={count}" for route, count in sorted(report["stub_requests"].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent app sessions")
+    parser.add_argument("--passes", type=int, default=1, help="times each session replays the corpus")
+    parser.add_argument("--prompts", default=DEFAULT_PROMPTS_PATH, help="file of prompts, one per line")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds before a completion starts")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument("--data-latency", type=float, default=0.05, help="seconds per data.gov.sg/OneMap request")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="share of completions that fail")
+    parser.add_argument("--data-failure-rate", type=float, default=0.0, help="share of data requests that fail")
+    parser.add_argument("--orchestration-mode", choices=["concurrent", "sequential"], default="concurrent")
+    parser.add_argument("--turn-timeout", type=float, default=120.0, help="seconds before a turn is abandoned")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report and every turn as JSON to this path")
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.prompts) * args.passes
+    settings = StubSettings(llm_latency=args.llm_latency, token_delay=args.token_delay,
+                            data_latency=args.data_latency, llm_failure_rate=args.llm_failure_rate,
+                            data_failure_rate=args.data_failure_rate, seed=args.seed)
+
+    with StubServers(settings) as stubs, tempfile.TemporaryDirectory(prefix="school-finder-bench-") as cache_dir:
+        # Must be set before the app modules are imported, they read it at import time
+        os.environ.update(stubs.environment())
+        os.environ["SCHOOL_FINDER_CACHE_DIR"] = cache_dir
+        os.environ["SCHOOL_FINDER_TRACE_EXPORT"] = "0"
+        os.chdir(REPO_DIR)
+
+        # Sync the stub collection and build the local indexes up front, as a deployed app would have them
+        import school_data
+        from psle_index import build_psle_index
+        from school_store import get_chroma_client, get_school_collection, ingest_school_profiles
+        started = time.perf_counter()
+        school_data.refresh_school_table()
+        build_psle_index()
+        # Sessions then only open the ChromaDB store, which cannot be created by several processes at once
+        ingest_school_profiles(get_school_collection(get_chroma_client()))
+        print(f"Prepared local data in {time.perf_counter() - started:.2f}s")
+        warmup_counts = stubs.snapshot()
+
+        secrets = {
+            "password": "benchmark",
+            "openai_api_key": "stub",
+            "orchestration_mode": args.orchestration_mode,
+        }
+        # AppTest keeps global state for the run in progress, so each session gets its own
+        # process; they share the stand-in servers and the on-disk caches
+        turns = []
+        with ProcessPoolExecutor(max_workers=args.sessions, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(run_session, session_id, prompts, args.turn_timeout, secrets)
+                       for session_id in range(args.sessions)]
+            for future in futures:
+                turns.extend(future.result())
+
+        stub_counts = {route: count - warmup_counts.get(route, 0) for route, count in stubs.snapshot().items()
+                       if count - warmup_counts.get(route, 0)}
+
+    report = summarise(turns, stub_counts)
+    report["settings"] = vars(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"report": report, "turns": turns}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
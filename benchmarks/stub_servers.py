@@ -0,0 +1,301 @@
+"""Local stand-ins for the external APIs the app calls, for offline benchmarks.
+
+One threaded HTTP server answers:
+
+- ``POST /v1/chat/completions`` like the OpenAI API, streamed or not, and in JSON mode
+- the data.gov.sg collection/dataset metadata and ``datastore_search`` endpoints,
+  serving a synthetic school collection
+- the OneMap ``elastic/search`` endpoint, with made-up coordinates in Singapore
+
+Every route can be slowed down and made to fail at a given rate, and the server
+counts the requests it answers so the benchmark can report calls per turn.
+"""
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SCHOOL_COLLECTION_ID = 457
+GENERAL_INFO_DATASET = "d_stub_general_information"
+CCA_DATASET = "d_stub_ccas"
+PROGRAMME_DATASET = "d_stub_programmes"
+
+PLACES = [
+    "Ang Mo Kio", "Bedok", "Bishan", "Bukit Batok", "Bukit Panjang", "Changi", "Clementi", "Dunearn",
+    "Geylang", "Hougang", "Jurong", "Kallang", "Kranji", "Marsiling", "Pasir Ris", "Punggol",
+    "Queenstown", "Sembawang", "Sengkang", "Serangoon", "Tampines", "Tanglin", "Toa Payoh", "Woodlands",
+    "Yishun", "Yio Chu Kang", "Zhenghua", "Compassvale", "Edgefield", "Fuchun",
+]
+SUFFIXES = ["Secondary School", "View Secondary School", "Springs Secondary School"]
+ZONES = ["NORTH", "SOUTH", "EAST", "WEST", "CENTRAL"]
+CCAS = ["Basketball", "Football", "Robotics Club", "Symphonic Band", "Chinese Orchestra", "Scouts",
+        "Drama Club", "Badminton", "Track and Field", "National Cadet Corps", "Choir", "Art Club"]
+PROGRAMMES = ["Applied Learning Programme in Robotics", "Language Elective Programme",
+              "Learning for Life Programme in Sports", "Music Elective Programme", "Art Elective Programme"]
+
+
+def build_school_collection(seed=0):
+    """Return {dataset_id: (name, records)} for a synthetic copy of the school collection."""
+    rng = random.Random(seed)
+    general, ccas, programmes = [], [], []
+    for place in PLACES:
+        for suffix in SUFFIXES:
+            name = f"{place} {suffix}".upper()
+            postal_code = f"{rng.randint(100000, 829999)}"
+            general.append({
+                "school_name": name,
+                "address": f"{rng.randint(1, 99)} {place.upper()} STREET {rng.randint(1, 40)}",
+                "postal_code": postal_code,
+                "zone_code": rng.choice(ZONES),
+                "dgp_code": place.upper(),
+                "mainlevel_code": rng.choice(["SECONDARY", "SECONDARY", "MIXED LEVELS", "PRIMARY"]),
+                "nature_code": "CO-ED SCHOOL",
+                "type_code": "GOVERNMENT SCHOOL",
+                "mrt_desc": f"{place} MRT, {rng.choice(PLACES)} MRT",
+                "bus_desc": ", ".join(str(rng.randint(2, 990)) for _ in range(rng.randint(3, 8))),
+                "sap_ind": "No",
+                "autonomous_ind": rng.choice(["Yes", "No"]),
+                "gifted_ind": "No",
+                "ip_ind": "No",
+            })
+            for cca in rng.sample(CCAS, rng.randint(3, 7)):
+                ccas.append({"school_name": name, "cca_generic_name": cca})
+            for programme in rng.sample(PROGRAMMES, rng.randint(1, 2)):
+                programmes.append({"school_name": name, "moe_programme_desc": programme})
+    return {
+        GENERAL_INFO_DATASET: ("General information of schools", general),
+        CCA_DATASET: ("Co-curricular activities (CCAs)", ccas),
+        PROGRAMME_DATASET: ("MOE programmes", programmes),
+    }
+
+
+class StubSettings:
+    """Latency and failure injection for the stand-in servers; all times are in seconds."""
+
+    def __init__(self, llm_latency=0.5, token_delay=0.01, data_latency=0.05,
+                 llm_failure_rate=0.0, data_failure_rate=0.0, seed=0):
+        self.llm_latency = llm_latency
+        self.token_delay = token_delay
+        self.data_latency = data_latency
+        self.llm_failure_rate = llm_failure_rate
+        self.data_failure_rate = data_failure_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    def should_fail(self, rate):
+        with self.random_lock:
+            return self.random.random() < rate
+
+
+# Function to make up a reply for a chat request; the routing fallback gets a yes/no answer
+def _completion_text(messages):
+    prompt = messages[-1].get("content", "") if messages else ""
+    if "similar in meaning" in prompt:
+        return "no"
+    words = ("Here is a balanced view of the schools you mentioned, covering academic fit, "
+             "travel time, CCAs and programmes, with the trade-offs to weigh for each option.").split()
+    return " ".join(words)
+
+
+# Function to make up a structured (JSON mode) reply, with a verdict for every school in the request
+def _json_completion_text(messages):
+    prompt = messages[-1].get("content", "") if messages else ""
+    schools = [json.loads(line) for line in prompt.splitlines() if line.startswith("{")]
+    return json.dumps({"schools": [
+        {"school_name": school.get("school_name", ""), "rating": 3,
+         "comment": "A reasonable option, with trade-offs in travel time and CCAs to weigh."}
+        for school in schools
+    ]})
+
+
+def _count_tokens(text):
+    return max(1, len(text.split()))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    @property
+    def stub(self):
+        return self.server.stub
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_json()
+        if not path.endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"No stub for {path}"}})
+
+        settings = self.stub.settings
+        self.stub.count("openai.chat.completions")
+        time.sleep(settings.llm_latency)
+        if settings.should_fail(settings.llm_failure_rate):
+            self.stub.count("openai.failures")
+            return self._send_json(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            text = _json_completion_text(body.get("messages", []))
+        else:
+            text = _completion_text(body.get("messages", []))
+        prompt_tokens = sum(_count_tokens(message.get("content", "")) for message in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": _count_tokens(text),
+                 "total_tokens": prompt_tokens + _count_tokens(text)}
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+
+        if not body.get("stream"):
+            time.sleep(settings.token_delay * _count_tokens(text))
+            return self._send_json(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}
+            ]))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunks = [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]
+        chunks += [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None} for word in text.split()]
+        chunks += [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        try:
+            for choice in chunks:
+                self._send_event(dict(base, object="chat.completion.chunk", choices=[choice]))
+                time.sleep(settings.token_delay)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._send_event(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up, e.g. after a generation timeout
+
+    def _send_event(self, event):
+        self.wfile.write(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        settings = self.stub.settings
+        route = "onemap.search" if url.path.endswith("/elastic/search") else "data_gov_sg." + (
+            "datastore_search" if url.path.endswith("/datastore_search") else
+            "collection_metadata" if "collections" in parts else
+            "dataset_metadata" if "datasets" in parts else "unknown"
+        )
+        self.stub.count(route)
+        time.sleep(settings.data_latency)
+        if settings.should_fail(settings.data_failure_rate):
+            self.stub.count(f"{route}.failures")
+            return self._send_json(503, {"error": "Injected failure"})
+
+        if route == "onemap.search":
+            return self._send_json(200, {"results": [self.stub.coordinates(query.get("searchVal", ""))]})
+        if route == "data_gov_sg.collection_metadata":
+            return self._send_json(200, {"data": {"collectionMetadata": {
+                "collectionId": parts[-2], "childDatasets": list(self.stub.datasets)}}})
+        if route == "data_gov_sg.dataset_metadata":
+            dataset_id = parts[-2]
+            if dataset_id not in self.stub.datasets:
+                return self._send_json(404, {"error": f"Unknown dataset {dataset_id}"})
+            return self._send_json(200, {"data": {"datasetId": dataset_id, "name": self.stub.datasets[dataset_id][0],
+                                                  "lastUpdatedAt": self.stub.updated_at}})
+        if route == "data_gov_sg.datastore_search":
+            _, records = self.stub.datasets.get(query.get("resource_id"), ("", []))
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 100))
+            page = [dict(record, _id=position + 1) for position, record in
+                    enumerate(records[offset:offset + limit], start=offset)]
+            return self._send_json(200, {"success": True, "result": {"records": page, "total": len(records)}})
+        return self._send_json(404, {"error": f"No stub for {url.path}"})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is expected; anything else is still reported
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubServers:
+    """Runs the stand-in servers on a local port in a background thread."""
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.settings = settings or StubSettings()
+        self.datasets = build_school_collection(self.settings.random.randint(0, 2 ** 31))
+        self.updated_at = "2024-01-01T00:00:00+08:00"
+        self.counts = Counter()
+        self._counts_lock = threading.Lock()
+        self.server = StubServer((host, port), StubHandler)
+        self.server.stub = self
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, route):
+        with self._counts_lock:
+            self.counts[route] += 1
+
+    def snapshot(self):
+        with self._counts_lock:
+            return dict(self.counts)
+
+    # Function to place a query at a stable point inside Singapore's bounding box
+    @staticmethod
+    def coordinates(query):
+        digest = hashlib.sha256(query.encode("utf-8")).digest()
+        lat = 1.28 + digest[0] / 255 * 0.16
+        lon = 103.70 + digest[1] / 255 * 0.25
+        return {"SEARCHVAL": query, "LATITUDE": f"{lat:.6f}", "LONGITUDE": f"{lon:.6f}"}
+
+    def environment(self):
+        """Environment variables that point the app's clients at these servers."""
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "OPENAI_API_KEY": "stub",
+            "DATA_GOV_SG_API_URL": self.url,
+            "DATA_GOV_SG_URL": self.url,
+            "ONEMAP_API_URL": self.url,
+        }
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    with StubServers() as stubs:
+        for name, value in stubs.environment().items():
+            print(f"export {name}={value}")
+        print("Stub servers running, press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
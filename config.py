@@ -0,0 +1,23 @@
+import os
+import threading
+
+# Directory for local data snapshots and caches, shared by every module
+CACHE_DIR = os.environ.get("SCHOOL_FINDER_CACHE_DIR", ".cache")
+
+
+def atomic_write(path, writer, binary=False):
+    """Write a file through writer(file) and move it into place, so readers never see it half-written.
+
+    The temp file is named per process and thread, so app processes and threads
+    writing the same file at once do not clobber each other's copy.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as temp_file:
+            writer(temp_file)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
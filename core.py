@@ -0,0 +1,694 @@
+"""UI-free core of the chatbot: routing, retrieval and the agents' replies.
+
+streamlit_app.py and api.py are thin front ends over run_turn(), which answers
+one message and yields events for the front end to render or stream:
+
+- {"type": "route", "response_type": ...}
+- {"type": "message", "role": ...}                  a new chat message starts
+- {"type": "chunk", "role": ..., "text": ...}       more text for that message
+- {"type": "done", "role": ..., "content": ...}     the complete message
+- {"type": "end", "memory": {...}, "trace": {...}}  updated memory and the turn's trace
+"""
+import json
+import os
+import time
+
+import openai
+from resources import lazy_import, resource
+from transport import find_school_mentions, lookup_transport  # Local, cached school name index
+from routing import get_router  # Local prompt routing
+from intents import get_intent_engine  # One-pass keyword and school detection
+from orchestration import DEFAULT_CALL_TIMEOUT, DEFAULT_MAX_CONCURRENCY, run_streams
+from psle_index import get_psle_index  # Pre-built index of psle_infosheet.pdf
+from school_data import get_school_table  # Local columnar copy of the school collection
+from school_query import format_recommendations, get_query_engine, recommend_schools  # Local school ranking
+from geo_index import DEFAULT_RADIUS_KM, get_geo_index  # Spatial index of schools and MRT stations
+from school_store import get_chroma_client, get_school_collection, retrieve_school_context, warm_school_collection
+from response_cache import DEFAULT_MAX_ENTRIES, DEFAULT_SIMILARITY, DEFAULT_TTL, get_response_cache, number_terms
+from tracing import span, trace_turn  # Per-turn latency, token and cache-hit tracing
+from memory import DEFAULT_SUMMARY_TOKENS, DEFAULT_WINDOW_TOKENS, ConversationMemory
+
+# Settings read from Streamlit secrets or, for the API server, upper-cased environment variables
+DEFAULT_SETTINGS = {
+    "openai_api_key": None,
+    # Angel and Devil orchestration: "concurrent" streams all agents at once, "sequential" runs them in turn
+    "orchestration_mode": "concurrent",
+    "max_concurrent_generations": DEFAULT_MAX_CONCURRENCY,
+    "generation_timeout_seconds": DEFAULT_CALL_TIMEOUT,
+    "response_cache_ttl_seconds": DEFAULT_TTL,
+    "response_cache_max_entries": DEFAULT_MAX_ENTRIES,
+    "response_cache_similarity": DEFAULT_SIMILARITY,
+    "memory_window_tokens": DEFAULT_WINDOW_TOKENS,
+    "memory_summary_tokens": DEFAULT_SUMMARY_TOKENS,
+}
+settings = dict(DEFAULT_SETTINGS)
+
+AGENT_ROLES = ["Student Councillor Bot", "Angel Bot", "Devil Bot"]
+FAILED_REPLY = "I'm having trouble generating a response right now. Please try again later."
+
+
+def configure(values):
+    """Apply settings from any mapping (Streamlit secrets, environment); missing keys keep their value."""
+    for key, default in DEFAULT_SETTINGS.items():
+        value = values.get(key)
+        if value is not None:
+            settings[key] = type(default)(value) if default is not None else value
+    if settings["openai_api_key"]:
+        openai.api_key = settings["openai_api_key"]
+
+
+def settings_from_environment():
+    return {key: os.environ.get(key.upper()) for key in DEFAULT_SETTINGS}
+
+
+# Function to pick out what a reused answer must agree on exactly: numbers and the schools named
+def cache_key_terms(prompt):
+    return number_terms(prompt) | frozenset(find_school_mentions(prompt))
+
+
+# Persistent cache of LLM answers, shared by every session in this process
+def get_cache():
+    return get_response_cache(
+        ttl=settings["response_cache_ttl_seconds"],
+        max_entries=settings["response_cache_max_entries"],
+        similarity=settings["response_cache_similarity"],
+        key_terms=cache_key_terms,
+    )
+
+
+def load_memory(state):
+    """Rebuild a conversation memory from its to_dict() state, or start a new one."""
+    return ConversationMemory.from_dict(
+        state,
+        window_tokens=settings["memory_window_tokens"],
+        summary_tokens=settings["memory_summary_tokens"],
+    )
+
+
+# Open the on-disk ChromaDB school store once per process and top it up in the background
+@resource("school_knowledge_store")
+def get_school_knowledge_store():
+    collection = get_school_collection(get_chroma_client())
+    warm_school_collection(collection)
+    return collection
+
+
+# Define Agent instances with necessary attributes, built once per process on first use
+@resource("agents")
+def get_agents():
+    Agent = lazy_import("crewai").Agent  # Only import Agent, omitting AgentManager
+
+    angel_agent = Agent(
+        name="Angel",
+        description="A positive and encouraging guide for students choosing secondary schools.",
+        personality="optimistic, supportive, solution-oriented, personalised",
+        role="Highlights potential benefits and aligns school options with the student's goals and aspirations.",
+        tone="Sympathetic, friendly, and encouraging, using UK spelling",
+        dialogue_style="Conversational English with UK spelling, balanced with Devil Bot for constructive debate",
+        additional_traits="Acknowledges anxieties, provides constructive solutions, and highlights personalised benefits of each option",
+        goal="To help students find schools that align with their strengths and interests",
+        backstory="An experienced educational advisor with a passion for helping students succeed in the right environment."
+    )
+
+    devil_agent = Agent(
+        name="Devil",
+        description="A realistic and pragmatic advisor who emphasises logistical concerns and challenges.",
+        personality="realistic, thought-provoking, cautious, individualised",
+        role="Raises important questions, prompts critical thinking, and points out potential challenges in each school option",
+        tone="Direct, slightly mischievous, uses Singlish with UK spelling",
+        dialogue_style="Playful banter and tag-teaming with Angel Bot, Singlish to make conversations relatable",
+        additional_traits="Highlights potential challenges and thought-provoking questions to help users consider practical limitations, like distance, friends",
+        goal="To ensure students make well-considered, practical school choices",
+        backstory="A practical advisor who values logical decision-making and enjoys challenging students to think realistically."
+    )
+
+    student_councillor_agent = Agent(
+        name="Student Councillor",
+        description="A friendly and knowledgeable guide who provides factual information about school programs, CCAs, and other school-related details.",
+        personality="welcoming, friendly, knowledgeable, organised, impartial",
+        role="Provides neutral, detailed, and accurate information about the school system, specific schools, programs, and CCAs.",
+        tone="Friendly and approachable, with standard UK English.",
+        dialogue_style="Neutral, helpful, and clear",
+        goal="To inform students objectively about school offerings and requirements",
+        backstory="A reliable source of educational information with extensive experience in the school system."
+    )
+
+    return {
+        "Angel": angel_agent,
+        "Devil": devil_agent,
+        "Student Councillor": student_councillor_agent,
+    }
+
+
+# Define trigger phrases for Angel and Devil
+angel_devil_triggers = [
+    "I need the Angel and Devil to weigh in", "I'm not sure", "not sure leh",
+    "both perspectives", "different opinions", "angel and devil",
+    "good and bad", "pros and cons", "positive and negative"
+]
+
+# Keywords for informational queries
+informational_keywords = ["program", "CCA", "school info", "subject", "facility", "details"]
+
+# Transport keyword detection with various permutations
+transport_keywords = [
+    "bus to", "mrt to", "which bus", "which mrt",
+    "how to get to", "directions to", "what bus goes to",
+    "what mrt goes to", "bus route to", "mrt route to",
+    "transport to", "how do I get to", "nearest bus to",
+    "nearest mrt to", "get there", "go there", "goes there"
+]
+
+# Keywords for PSLE queries
+psle_keywords = ["psle", "scoring"]
+
+# Keyword sets the local router weighs against the Angel and Devil triggers
+router_keyword_sets = {
+    "transport": transport_keywords,
+    "informational": informational_keywords,
+    "psle": psle_keywords,
+}
+
+# Prompts too vague to answer without asking the student for more information
+vague_prompts = ["how do I start?", "how to choose?", "help me find a school", "what should I do?"]
+vague_prompt_reply = "Could you tell me a bit about your interests, strengths, or any preferences you have in a school? This will help me tailor my recommendations to suit you better."
+
+# Every keyword set the intent engine matches in one pass; informational keywords also match
+# longer word forms ("CCA" -> "CCAs", "program" -> "programmes")
+intent_keyword_sets = {
+    "angel_and_devil": angel_devil_triggers,
+    "councillor": ["ask student councillor"],
+    "school_data": ["school data"],
+    "vague": vague_prompts,
+    **router_keyword_sets,
+}
+prefix_intent_labels = ("informational",)
+
+
+# Function to work out once what a prompt asks for and which schools it names
+def detect_intent(prompt, memory=None):
+    with span("intent") as current:
+        intent = get_intent_engine(intent_keyword_sets, prefix_intent_labels).detect(
+            prompt, memory.schools if memory is not None else ()
+        )
+        current.set(labels=sorted(intent.labels), schools=len(intent.schools))
+        return intent
+
+
+# Define function to check if prompt is similar to trigger phrases; None when the API call fails
+def is_similar_to_trigger(prompt, trigger_phrases):
+    with span("llm.routing_fallback", model="gpt-4o") as current:
+        try:
+            response = openai.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that determines if sentences are similar in meaning."},
+                    {"role": "user", "content": f"Is the following sentence similar in meaning to any of these: {', '.join(trigger_phrases)}? \n\n Sentence: '{prompt}'"}
+                ],
+                temperature=0
+            )
+            record_usage(current, response.usage)
+            answer = response.choices[0].message.content.strip().lower()
+            return answer in ["yes", "true", "similar", "definitely"]
+        except Exception as e:
+            print(f"Error with OpenAI API: {e}")
+            current.error = type(e).__name__
+            return None
+
+
+# Function to check if the prompt is informational
+def is_informational_query(prompt, intent=None):
+    return (intent or detect_intent(prompt)).has("informational")
+
+
+# Enhanced function to get response type
+def get_response_type(prompt, intent=None):
+    intent = intent or detect_intent(prompt)
+    with span("routing") as current:
+        if intent.vague:
+            # Ask the student for more to go on before anyone weighs in
+            response_type = "student_councillor"
+        elif should_invoke_angel_and_devil(prompt, angel_devil_triggers, intent):
+            response_type = "angel_and_devil"
+        elif intent.has("councillor") or is_informational_query(prompt, intent):
+            response_type = "student_councillor"
+        else:
+            # Default to the Student Councillor
+            response_type = "student_councillor"
+        current.set(response_type=response_type)
+        return response_type
+
+
+# Function to determine whether to invoke Angel and Devil
+# The verdict is memoised per prompt, and only ambiguous prompts fall back to the LLM
+def should_invoke_angel_and_devil(prompt, trigger_phrases, intent=None):
+    if intent is not None:
+        # A trigger phrase said outright, or a plain request for facts, needs no similarity check
+        if intent.has("angel_and_devil"):
+            return True
+        if intent.labels & {"councillor", "school_data", *router_keyword_sets}:
+            return False
+    router = get_router(trigger_phrases, router_keyword_sets)
+    return router.wants_angel_and_devil(
+        prompt, llm_fallback=lambda ambiguous_prompt: is_similar_to_trigger(ambiguous_prompt, trigger_phrases)
+    )
+
+
+# Context shared by every agent's system prompt
+agent_context_message = ("You are assisting a student with finding the right secondary school. "
+                         "Keep responses focused on school recommendations. Use Singapore schools only. "
+                         "List each recommendation as bullet points. Ask about their strengths, interests, and if they have any special programmes in mind.")
+
+# Function to attach OpenAI token counts to a tracing span
+def record_usage(current, usage):
+    if usage is not None:
+        current.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+
+# Function to build the chat messages sent to OpenAI for an agent, after the conversation so far
+# grounding holds the retrieved facts and the other agents' replies for this turn
+def build_agent_messages(agent_name, prompt, history=(), grounding=""):
+    return [
+        {"role": "system", "content": f"You are {agent_name}. {agent_context_message}"},
+        *history,
+        *([{"role": "system", "content": grounding}] if grounding else []),
+        {"role": "user", "content": prompt}
+    ]
+
+
+# Function to key cached answers on everything but the student's prompt: the conversation so far
+# and the grounding must match exactly, so follow-ups and answers from other facts are not mixed up
+def cache_context(history, grounding=""):
+    context = agent_context_message
+    if history:
+        context += f"\n{json.dumps(list(history), sort_keys=True)}"
+    if grounding:
+        context += f"\n{grounding}"
+    return context
+
+
+# Function to generate a reply from OpenAI, reusing a cached answer where there is one
+def generate_openai_response(agent_name, prompt, history=(), grounding=""):
+    response_cache = get_cache()
+    with span(f"llm.{agent_name}", model="gpt-4o") as current:
+        # Reuse the answer to a near-identical earlier question when there is one
+        cached_response = response_cache.get(agent_name, cache_context(history, grounding), prompt)
+        current.set(cache_hit=cached_response is not None)
+        if cached_response is not None:
+            return cached_response
+
+        try:
+            # Requesting response from OpenAI API
+            response = openai.chat.completions.create(
+                model="gpt-4o",
+                messages=build_agent_messages(agent_name, prompt, history, grounding),
+                max_tokens=350,
+                temperature=0.7,
+                timeout=settings["generation_timeout_seconds"]
+            )
+            record_usage(current, response.usage)
+
+            # Extract the content from the response
+            if response.choices and len(response.choices) > 0:
+                choice = response.choices[0]
+                if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
+                    openai_response = choice.message.content.strip()
+                    if openai_response:
+                        response_cache.put(agent_name, cache_context(history, grounding), prompt, openai_response)
+                    return openai_response
+                else:
+                    raise ValueError("Unexpected response structure: 'message' or 'content' missing.")
+            else:
+                raise ValueError("Unexpected response structure: 'choices' missing or empty.")
+
+        except Exception as e:
+            print(f"Error with OpenAI API for {agent_name}: {e}")
+            current.error = type(e).__name__
+            return FAILED_REPLY
+
+
+# Function to stream a reply from OpenAI chunk by chunk; it runs on worker threads
+def stream_openai_response(agent_name, prompt, timeout=DEFAULT_CALL_TIMEOUT, history=(), grounding=""):
+    response_cache = get_cache()
+    with span(f"llm.{agent_name}", model="gpt-4o", streamed=True) as current:
+        cached_response = response_cache.get(agent_name, cache_context(history, grounding), prompt)
+        current.set(cache_hit=cached_response is not None)
+        if cached_response is not None:
+            yield cached_response
+            return
+
+        stream = openai.chat.completions.create(
+            model="gpt-4o",
+            messages=build_agent_messages(agent_name, prompt, history, grounding),
+            max_tokens=350,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout
+        )
+        chunks = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not chunks:
+                    current.set(first_token_ms=round((time.time() - current.started) * 1000, 2))
+                chunks.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+            # The final chunk carries the token counts when include_usage is set
+            record_usage(current, getattr(chunk, "usage", None))
+
+        # Only complete answers are cached; an interrupted stream raises before this point, and an
+        # empty one (e.g. stopped by the content filter) would replay as a blank message
+        full_response = "".join(chunks).strip()
+        if full_response:
+            response_cache.put(agent_name, cache_context(history, grounding), prompt, full_response)
+
+
+# Function to retrieve transport information for the destination the intent engine found
+def get_transport_info(intent):
+    school_name = intent.slots.get("destination")
+    if not school_name:
+        return "Please specify a destination for transport information."
+
+    try:
+        # Served from the local transport index, refreshed from data.gov.sg in the background
+        with span("retrieval.transport") as current:
+            transport_info = [
+                f"Bus routes: {record['bus_desc']}, MRT station: {record['mrt_desc']}"
+                for record in lookup_transport(school_name)
+            ]
+            current.set(results=len(transport_info))
+        return "\n".join(transport_info) if transport_info else f"No transport information found for {school_name.title()}."
+
+    except Exception as e:
+        print(f"Error retrieving data: {e}")
+        return f"Failed to retrieve transport data: {e}"
+
+
+# Function to search PSLE info
+def search_psle_info(prompt):
+    excerpts = psle_excerpts(prompt)
+    if not excerpts:
+        return "PSLE score ranges vary by school. Please refer to the MOE website for the most recent information."
+    return f"From the MOE PSLE infosheet:\n\n{excerpts}"
+
+
+# Function to find the passages of the MOE PSLE infosheet most relevant to a prompt, one per line
+def psle_excerpts(prompt):
+    try:
+        # Local retrieval over the pre-built index of the MOE PSLE infosheet
+        with span("retrieval.psle") as current:
+            results = get_psle_index().search(prompt, top_k=2)
+            current.set(results=len(results))
+    except Exception as e:
+        print(f"Error searching PSLE index: {e}")
+        return ""
+    return "\n".join(f"- {chunk['text']} (PSLE infosheet, page {chunk['page']})" for _, chunk in results)
+
+
+# Footer appended to every Student Councillor reply
+councillor_additional_message = ("For more detailed information on recent PSLE score ranges, "
+                                 "please check the MOE SchoolFinder at this URL: "
+                                 "[MOE SchoolFinder](https://www.moe.gov.sg/schoolfinder?journey=Secondary%20school)")
+
+
+# Summarise the local copy of the school collection, synced from data.gov.sg in the background
+def get_school_collection_data():
+    try:
+        table = get_school_table()
+    except Exception as e:
+        print(f"Failed to load school data: {e}")
+        return "School data is not available right now."
+
+    if not table.datasets:
+        return "School data is still being downloaded. Please try again shortly."
+    lines = [f"- {entry['dataset']}: {entry['rows']} records" for entry in table.summary()]
+    return "School data available from data.gov.sg:\n\n" + "\n".join(lines)
+
+
+# Function to gather facts the Student Councillor can answer from data, without the LLM
+def get_student_councillor_facts(prompt, intent):
+    if intent.has("transport"):
+        return get_transport_info(intent)
+
+    elif intent.has("school_data"):
+        return get_school_collection_data()
+
+    # "My PSLE score is 14 and I live at 460123..." asks for schools, so it is ranked instead
+    elif intent.has("psle") and not has_ranking_criteria(prompt):
+        return search_psle_info(prompt)
+
+    return None
+
+
+# Function to tell whether a prompt gives what schools are ranked by: an AL score, a postal code or a zone
+def has_ranking_criteria(prompt):
+    try:
+        criteria = get_query_engine().criteria_from_prompt(prompt)
+    except Exception as e:
+        print(f"Error reading criteria: {e}")
+        return False
+    return any(criteria.get(field) for field in ("al_score", "postal_code", "zones"))
+
+
+# Function to rank schools locally for the criteria in a prompt (AL score, zone, postal code, CCAs...)
+def get_school_recommendations(prompt):
+    try:
+        with span("retrieval.ranking") as current:
+            _, results = recommend_schools(prompt)
+            current.set(results=len(results))
+    except Exception as e:
+        print(f"Error ranking schools: {e}")
+        return ""
+    return format_recommendations(results)
+
+
+# Function to compute the Devil's practical facts: schools near the student's postal code
+# and the nearest MRT stations to any school mentioned, from the local spatial index
+def get_practical_facts(prompt, memory):
+    try:
+        with span("retrieval.geo"):
+            engine = get_query_engine()
+            geo = get_geo_index(engine)
+            criteria = engine.criteria_from_prompt(prompt)
+            facts = []
+            if criteria.get("postal_code"):
+                radius = criteria.get("max_distance_km", DEFAULT_RADIUS_KM)
+                nearby = geo.schools_near_postal_code(criteria["postal_code"], radius)[:8]
+                if nearby:
+                    listed = ", ".join(f"{name.title()} ({distance:.1f} km)" for name, distance in nearby)
+                    facts.append(f"Schools within {radius:g} km of {criteria['postal_code']}: {listed}")
+                else:
+                    facts.append(f"No schools found within {radius:g} km of {criteria['postal_code']}.")
+            # A follow-up like "how far is it from the MRT?" refers to the last school discussed
+            for school_name in find_school_mentions(memory.expand_query(prompt)):
+                stations = geo.nearest_stations(school_name, k=2)
+                if stations:
+                    listed = ", ".join(f"{name.title()} ({distance:.1f} km)" for name, distance in stations)
+                    facts.append(f"Nearest MRT stations to {school_name.title()}: {listed}")
+            return "\n".join(facts)
+    except Exception as e:
+        print(f"Error computing practical facts: {e}")
+        return ""
+
+
+# Function to add locally ranked schools, PSLE infosheet excerpts and the most relevant ChromaDB school profiles to a prompt
+def councillor_grounding(prompt, memory, intent, recommendations=None):
+    """Return the grounding for the Student Councillor's reply, sent alongside the prompt rather than in it.
+
+    recommendations is the output of get_school_recommendations(prompt) when the caller already has it.
+    """
+    grounding = []
+    if recommendations is None:
+        recommendations = get_school_recommendations(prompt)
+    if recommendations:
+        grounding.append(f"Recommend from these schools, which match the student's criteria (best first):\n{recommendations}")
+    if intent.has("psle"):
+        excerpts = psle_excerpts(prompt)
+        if excerpts:
+            grounding.append(f"Use these excerpts from the MOE PSLE infosheet where relevant:\n{excerpts}")
+
+    try:
+        with span("retrieval.chroma"):
+            school_context = retrieve_school_context(get_school_knowledge_store(), memory.expand_query(prompt))
+    except Exception as e:
+        print(f"Error retrieving school profiles: {e}")
+        school_context = ""
+    if school_context:
+        grounding.append(f"Use these school profiles where relevant:\n{school_context}")
+    return "\n\n".join(grounding)
+
+
+# Function to answer as the Student Councillor, from data where possible and otherwise the LLM
+def get_student_councillor_response(prompt, memory, intent):
+    if intent.vague:
+        return f"{vague_prompt_reply}\n\n{councillor_additional_message}"
+
+    facts = get_student_councillor_facts(prompt, intent)
+    if facts is not None:
+        return f"{facts}\n\n{councillor_additional_message}"
+
+    general_response = generate_openai_response(
+        "Student Councillor", prompt, memory.context_messages("Student Councillor"),
+        councillor_grounding(prompt, memory, intent)
+    )
+    return f"{general_response}\n\n{councillor_additional_message}"
+
+
+# Function to emit one complete chat message as events
+def message_events(role, content):
+    yield {"type": "message", "role": role}
+    yield {"type": "done", "role": role, "content": content}
+
+
+# Original one-after-another flow: Devil sees both the Student Councillor's and Angel's replies
+def sequential_angel_and_devil(prompt, memory, intent):
+    student_councillor_response = get_student_councillor_response(prompt, memory, intent)
+    yield from message_events("Student Councillor Bot", student_councillor_response)
+
+    # The other agents' replies are grounding, so the cache still compares only the student's prompt
+    angel_grounding = f"The Student Councillor said: '{student_councillor_response}' Now provide your perspective."
+    angel_response = generate_openai_response("Angel", prompt, memory.context_messages("Angel"), angel_grounding)
+    yield from message_events("Angel Bot", angel_response)
+
+    devil_grounding = (
+        f"The Student Councillor said: '{student_councillor_response}', "
+        f"and Angel added: '{angel_response}'. Now respond with your perspective."
+    )
+    practical_facts = get_practical_facts(prompt, memory)
+    if practical_facts:
+        devil_grounding += f" Base any distance or travel points on these computed facts:\n{practical_facts}"
+    devil_response = generate_openai_response("Devil", prompt, memory.context_messages("Devil"), devil_grounding)
+    yield from message_events("Devil Bot", devil_response)
+
+
+# All three agents generate at once from the shared facts, each streamed as its own chat message
+def concurrent_angel_and_devil(prompt, memory, intent):
+    facts = get_student_councillor_facts(prompt, intent)
+    shared_context = ""
+    if facts is not None:
+        shared_context += f"The Student Councillor found these facts: '{facts}'. "
+    recommendations = get_school_recommendations(prompt)
+    if recommendations:
+        shared_context += f"Schools matching the student's criteria (best first):\n{recommendations}\n"
+
+    timeout = settings["generation_timeout_seconds"]
+    histories = {name: memory.context_messages(name) for name in ["Student Councillor", "Angel", "Devil"]}
+    jobs = {}
+    if facts is None:
+        grounding = councillor_grounding(prompt, memory, intent, recommendations)
+        jobs["Student Councillor Bot"] = lambda: stream_openai_response(
+            "Student Councillor", prompt, timeout, histories["Student Councillor"], grounding
+        )
+    jobs["Angel Bot"] = lambda: stream_openai_response(
+        "Angel", prompt, timeout, histories["Angel"], f"{shared_context}Now provide your perspective."
+    )
+    devil_grounding = f"{shared_context}Angel is answering alongside you. Now respond with your perspective."
+    practical_facts = get_practical_facts(prompt, memory)
+    if practical_facts:
+        devil_grounding += f" Base any distance or travel points on these computed facts:\n{practical_facts}"
+    jobs["Devil Bot"] = lambda: stream_openai_response("Devil", prompt, timeout, histories["Devil"], devil_grounding)
+
+    # Start every chat message up front so they keep their order while streaming
+    replies = {role: "" for role in AGENT_ROLES}
+    for role in AGENT_ROLES:
+        yield {"type": "message", "role": role}
+    if facts is not None:
+        replies["Student Councillor Bot"] = str(facts)
+        yield {"type": "chunk", "role": "Student Councillor Bot", "text": replies["Student Councillor Bot"]}
+
+    # Messages are completed in AGENT_ROLES order, whichever agent finishes first, so the
+    # chat history, the memory and the API's messages always list the agents the same way
+    finished = {role for role in AGENT_ROLES if role not in jobs}
+    pending = list(AGENT_ROLES)
+    streams = run_streams(jobs, max_concurrency=settings["max_concurrent_generations"], timeout=timeout)
+    for role, kind, value in streams:
+        if kind == "chunk":
+            replies[role] += value
+            yield {"type": "chunk", "role": role, "text": value}
+        elif kind == "error":
+            print(f"Error with OpenAI API for {role}: {value}")
+            replies[role] = replies[role] or FAILED_REPLY
+        elif kind == "done":
+            finished.add(role)
+        while pending and pending[0] in finished:
+            yield done_event(pending.pop(0), replies)
+    for role in pending:
+        yield done_event(role, replies)
+
+
+def done_event(role, replies):
+    # The Student Councillor's footer is added once its reply is complete
+    if role == "Student Councillor Bot":
+        replies[role] = f"{replies[role]}\n\n{councillor_additional_message}"
+    return {"type": "done", "role": role, "content": replies[role]}
+
+
+# Determine if Angel and Devil should weigh in on Student Councillor response
+def angel_and_devil_weigh_in(prompt, memory, intent):
+    """Yield Angel and Devil responses if prompt meets criteria, otherwise the Student Councillor's."""
+    if should_invoke_angel_and_devil(prompt, angel_devil_triggers, intent):
+        if settings["orchestration_mode"] == "sequential":
+            yield from sequential_angel_and_devil(prompt, memory, intent)
+        else:
+            yield from concurrent_angel_and_devil(prompt, memory, intent)
+    else:
+        # If not invoking Angel and Devil, just get the Student Councillor's response
+        yield from message_events("Student Councillor Bot", get_student_councillor_response(prompt, memory, intent))
+
+
+def run_turn(prompt, memory_state=None):
+    """Answer one message, yielding the events described at the top of this module.
+
+    memory_state is the "memory" of the previous turn's end event, or None for a new conversation.
+    """
+    memory = load_memory(memory_state)
+    messages = []
+    # Every stage of the turn is timed as a span of one trace
+    with trace_turn(prompt) as trace:
+        # The prompt is scanned once; every later stage reads the intent
+        intent = detect_intent(prompt, memory)
+        response_type = get_response_type(prompt, intent)
+        yield {"type": "route", "response_type": response_type}
+        if response_type == "angel_and_devil":
+            events = angel_and_devil_weigh_in(prompt, memory, intent)
+        else:
+            # Default to Student Councillor
+            events = message_events("Student Councillor Bot", get_student_councillor_response(prompt, memory, intent))
+        for event in events:
+            if event["type"] == "done":
+                messages.append({"role": event["role"], "content": event["content"]})
+            yield event
+
+    memory.add_turn(prompt, messages)
+    yield {"type": "end", "memory": memory.to_dict(), "trace": trace.to_dict()}
+
+
+def answer(prompt, memory_state=None):
+    """Run a turn to completion and return {"response_type", "messages", "memory", "trace"}."""
+    result = {"messages": []}
+    for event in run_turn(prompt, memory_state):
+        if event["type"] == "route":
+            result["response_type"] = event["response_type"]
+        elif event["type"] == "done":
+            result["messages"].append({"role": event["role"], "content": event["content"]})
+        elif event["type"] == "end":
+            result["memory"] = event["memory"]
+            result["trace"] = event["trace"]
+    return result
+
+
+def warm_up():
+    """Load the local school table, indexes and ChromaDB store before the first request."""
+    # A failure here is reported and retried on first use, rather than stopping the app from starting
+    try:
+        get_query_engine()
+    except Exception as e:
+        print(f"Error loading the school table: {e}")
+    try:
+        get_psle_index()
+    except Exception as e:
+        print(f"Error building the PSLE index: {e}")
+    try:
+        get_school_knowledge_store()
+    except Exception as e:
+        print(f"Error opening the school knowledge store: {e}")
@@ -0,0 +1,162 @@
+import math
+import re
+import threading
+
+import numpy as np
+
+from geocode import geocode, geocode_many
+
+EARTH_RADIUS_KM = 6371.0088
+# Grid cell size in degrees, about 1.1 km in Singapore
+CELL_DEGREES = 0.01
+KM_PER_DEGREE = 111.32
+DEFAULT_RADIUS_KM = 3.0
+
+
+# Function to compute great-circle distances from one point to arrays of points, in km
+def haversine_km(lat, lon, lats, lons):
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class GridIndex:
+    """Uniform lat/long grid over a set of named points for radius and nearest-neighbour queries."""
+
+    def __init__(self, names, lats, lons):
+        known = ~(np.isnan(lats) | np.isnan(lons))
+        self.names = np.asarray(names, dtype=str)[known]
+        self.lats = np.asarray(lats, dtype=float)[known]
+        self.lons = np.asarray(lons, dtype=float)[known]
+
+        self.cells = {}
+        rows = np.floor(self.lats / CELL_DEGREES).astype(int)
+        columns = np.floor(self.lons / CELL_DEGREES).astype(int)
+        for position, cell in enumerate(zip(rows.tolist(), columns.tolist())):
+            self.cells.setdefault(cell, []).append(position)
+        self.cells = {cell: np.array(positions) for cell, positions in self.cells.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _candidates(self, lat, lon, ring):
+        row, column = math.floor(lat / CELL_DEGREES), math.floor(lon / CELL_DEGREES)
+        found = [
+            self.cells[(row + row_step, column + column_step)]
+            for row_step in range(-ring, ring + 1)
+            for column_step in range(-ring, ring + 1)
+            if (row + row_step, column + column_step) in self.cells
+        ]
+        return np.concatenate(found) if found else np.array([], dtype=int)
+
+    def within(self, lat, lon, radius_km):
+        """Return (name, distance_km) for every point within radius_km, nearest first."""
+        ring = math.ceil(radius_km / (KM_PER_DEGREE * CELL_DEGREES * max(math.cos(math.radians(lat)), 0.1)))
+        candidates = self._candidates(lat, lon, ring)
+        distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = distances <= radius_km
+        order = np.lexsort((self.names[candidates][inside], distances[inside]))
+        return [
+            (str(self.names[candidates][inside][position]), float(distances[inside][position]))
+            for position in order
+        ]
+
+    def nearest(self, lat, lon, k=1):
+        """Return the k nearest (name, distance_km) pairs, widening the search ring as needed."""
+        if not len(self):
+            return []
+        ring = 1
+        while True:
+            candidates = self._candidates(lat, lon, ring)
+            searched_km = ring * KM_PER_DEGREE * CELL_DEGREES * math.cos(math.radians(lat))
+            if len(candidates) >= k or len(candidates) == len(self):
+                distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+                order = np.lexsort((self.names[candidates], distances))[:k]
+                # Only trust the answer if nothing outside the searched square could be closer
+                if distances[order[-1]] <= searched_km or len(candidates) == len(self):
+                    return [(str(self.names[candidates][position]), float(distances[position])) for position in order]
+            ring *= 2
+
+
+# Function to pull station names out of data.gov.sg mrt_desc strings, e.g. "Bedok MRT, Tanah Merah MRT"
+def parse_station_names(mrt_desc):
+    stations = []
+    for part in re.split(r"[,/;&]|\band\b", mrt_desc or "", flags=re.IGNORECASE):
+        name = re.sub(r"\b(mrt|lrt|station|stn)\b", "", part, flags=re.IGNORECASE)
+        name = " ".join(name.split()).upper()
+        if name and name not in ("NA", "NIL") and not name.isdigit():
+            stations.append(name)
+    return stations
+
+
+class GeoIndex:
+    """Spatial indexes over school locations and the MRT/LRT stations they list."""
+
+    def __init__(self, schools, stations):
+        self.schools = schools
+        self.stations = stations
+
+    @classmethod
+    def build(cls, engine, offline=True):
+        station_names = sorted({
+            station
+            for profile in engine.profiles
+            for station in parse_station_names(profile.get("mrt", ""))
+        })
+        queries = {name: f"{name} MRT STATION" for name in station_names}
+        found = geocode_many(queries.values(), offline=offline)
+        points = [found.get(queries[name]) or (np.nan, np.nan) for name in station_names]
+        return cls(
+            GridIndex(engine.names, engine.lats, engine.lons),
+            GridIndex(station_names, np.array([point[0] for point in points], dtype=float),
+                      np.array([point[1] for point in points], dtype=float)),
+        )
+
+    def school_location(self, school_name):
+        matches = np.flatnonzero(self.schools.names == school_name)
+        if not len(matches):
+            return None
+        return float(self.schools.lats[matches[0]]), float(self.schools.lons[matches[0]])
+
+    def schools_near_postal_code(self, postal_code, radius_km=DEFAULT_RADIUS_KM):
+        home = geocode(postal_code)
+        return self.schools.within(home[0], home[1], radius_km) if home else []
+
+    def nearest_stations(self, school_name, k=1):
+        location = self.school_location(school_name)
+        return self.stations.nearest(location[0], location[1], k) if location else []
+
+
+_geo_lock = threading.Lock()
+_geo_index = None
+_geo_engine = None
+_geocoding_started = False
+
+
+# Function to geocode stations missing from the cache, then force a rebuild that includes them
+def _geocode_stations(engine):
+    global _geo_engine
+    try:
+        GeoIndex.build(engine, offline=False)
+    except Exception as e:
+        print(f"Error geocoding MRT stations: {e}")
+    with _geo_lock:
+        _geo_engine = None
+
+
+def get_geo_index(engine):
+    """Return the spatial index for the given query engine, rebuilding it when the engine changes."""
+    global _geo_index, _geo_engine, _geocoding_started
+    with _geo_lock:
+        if _geo_engine is engine:
+            return _geo_index
+    geo_index = GeoIndex.build(engine)
+
+    with _geo_lock:
+        _geo_index, _geo_engine = geo_index, engine
+        start_geocoding = not _geocoding_started
+        _geocoding_started = True
+    if start_geocoding:
+        threading.Thread(target=_geocode_stations, args=(engine,), daemon=True).start()
+    return geo_index
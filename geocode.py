@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+
+from config import CACHE_DIR, atomic_write
+from http_client import CircuitOpenError, get_http_client
+
+# OneMap (Singapore Land Authority) search API, which needs no key for address lookups
+ONEMAP_API_URL = os.environ.get("ONEMAP_API_URL", "https://www.onemap.gov.sg").rstrip("/")
+ONEMAP_SEARCH_URL = ONEMAP_API_URL + "/api/common/elastic/search"
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, "geocode.json")
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(GEOCODE_CACHE_PATH, "r", encoding="utf-8") as cache_file:
+                _cache = json.load(cache_file)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache():
+    atomic_write(GEOCODE_CACHE_PATH, lambda cache_file: json.dump(_cache, cache_file))
+
+
+# Function to ask OneMap for the coordinates of a postal code or place name
+def _search_onemap(query):
+    params = {"searchVal": query, "returnGeom": "Y", "getAddrDetails": "N", "pageNum": 1}
+    results = get_http_client("onemap").get_json(ONEMAP_SEARCH_URL, params=params).get("results", [])
+    if not results:
+        return None
+    return [float(results[0]["LATITUDE"]), float(results[0]["LONGITUDE"])]
+
+
+def geocode_many(queries, offline=False):
+    """Return {query: (lat, lon) or None}, calling OneMap only for queries not cached yet.
+
+    Misses are cached too, so an unknown postal code is only looked up once.
+    """
+    keys = {query: str(query).strip().upper() for query in queries if query}
+    with _cache_lock:
+        cache = _load_cache()
+        missing = sorted({key for key in keys.values() if key not in cache})
+
+    if missing and not offline:
+        found = {}
+        for key in missing:
+            try:
+                found[key] = _search_onemap(key)
+            except CircuitOpenError as e:
+                print(f"Stopped geocoding: {e}")
+                break
+            except Exception as e:
+                print(f"Error geocoding {key}: {e}")
+        with _cache_lock:
+            cache.update(found)
+            _save_cache()
+
+    with _cache_lock:
+        return {query: tuple(cache[key]) if cache.get(key) else None for query, key in keys.items()}
+
+
+def geocode(query, offline=False):
+    """Return (lat, lon) for a postal code or place name, or None when it cannot be found."""
+    return geocode_many([query], offline=offline).get(query)
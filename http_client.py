@@ -0,0 +1,252 @@
+"""Shared HTTP client for the external APIs the app calls (data.gov.sg, OneMap).
+
+Each upstream gets one process-wide client with a pooled session, strict
+connect/read timeouts and retries with jittered exponential backoff.
+Identical requests already in flight are coalesced, so sessions asking for the
+same thing at once share one upstream call. A per-upstream circuit breaker
+stops calling a host that keeps failing and serves the last good response for
+a request instead, while one trial request at a time checks for recovery.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracing import span
+
+DEFAULT_TIMEOUT = (3.05, 15)  # (connect, read) seconds
+DEFAULT_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Consecutive failed requests before the breaker opens, and how long it stays open
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+# Last good responses kept per client for serving stale data
+STALE_ENTRIES = 256
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open, when no stale copy exists."""
+
+
+class UpstreamError(Exception):
+    """Raised when a request still fails with a retryable status after all retries."""
+
+    def __init__(self, response):
+        super().__init__(f"{response.status_code} from {response.url}")
+        self.response = response
+
+
+class CircuitBreaker:
+    """Counts consecutive failures of one upstream and short-circuits calls while it is down."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        """Return True if a request may go out; after the reset period only one trial request at a time."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """End a trial request that failed for a reason other than the upstream, leaving the counts alone."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class HttpClient:
+    """Pooled, retrying, coalescing HTTP client for one upstream service."""
+
+    def __init__(self, name, pool_size=8, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 breaker=None, sleep=time.sleep):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        # Retries are done here, with jitter, rather than by urllib3
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._stale = OrderedDict()
+        self._stale_lock = threading.Lock()
+
+    @staticmethod
+    def _request_key(url, params, headers):
+        return (url, tuple(sorted((params or {}).items())), tuple(sorted((headers or {}).items())))
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_CAP)
+        # Full jitter keeps retries from many sessions from arriving in lockstep
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def _remember(self, key, response):
+        with self._stale_lock:
+            self._stale[key] = response
+            self._stale.move_to_end(key)
+            while len(self._stale) > STALE_ENTRIES:
+                self._stale.popitem(last=False)
+
+    def _stale_copy(self, key):
+        with self._stale_lock:
+            response = self._stale.get(key)
+        if response is not None:
+            response.from_stale = True
+        return response
+
+    def _send(self, url, params, headers, timeout, key, current):
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                current.set(breaker="open")
+                stale = self._stale_copy(key)
+                if stale is not None:
+                    current.set(stale=True)
+                    return stale
+                raise CircuitOpenError(f"{self.name} is unavailable after repeated failures, calls are paused")
+
+            response = None
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    if response.ok:
+                        self._remember(key, response)
+                    current.set(status=response.status_code, attempts=attempt + 1)
+                    return response
+                last_error = UpstreamError(response)
+            except requests.RequestException as e:
+                last_error = e
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_failure()
+            if attempt < self.retries:
+                self._sleep(self._backoff(attempt, response))
+
+        current.set(attempts=self.retries + 1)
+        stale = self._stale_copy(key)
+        if stale is not None:
+            current.set(stale=True)
+            return stale
+        raise last_error
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        """GET a URL, returning the response (possibly a stale copy flagged with from_stale=True).
+
+        Identical requests made while one is in flight wait for it and share its response.
+        """
+        key = self._request_key(url, params, headers)
+        with self._in_flight_lock:
+            shared = self._in_flight.get(key)
+            if shared is None:
+                future = self._in_flight[key] = Future()
+
+        if shared is not None:
+            with span(f"http.{self.name}", coalesced=True):
+                return shared.result()
+
+        try:
+            with span(f"http.{self.name}") as current:
+                response = self._send(url, params, headers, timeout or self.timeout, key, current)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+    def get_json(self, url, params=None, headers=None, timeout=None):
+        response = self.get(url, params=params, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    # POSTs are not idempotent, so they are neither retried nor coalesced; the breaker still applies
+    def _post(self, url, payload, headers, timeout, current, stream=False):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable after repeated failures, calls are paused")
+        try:
+            response = self.session.post(url, json=payload, headers=headers,
+                                         timeout=timeout or self.timeout, stream=stream)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        current.set(status=response.status_code)
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def post_json(self, url, payload, headers=None, timeout=None):
+        """POST JSON and return the decoded JSON reply."""
+        with span(f"http.{self.name}") as current:
+            response = self._post(url, payload, headers, timeout, current)
+            response.raise_for_status()
+            return response.json()
+
+    def post_lines(self, url, payload, headers=None, timeout=None):
+        """POST JSON and yield the non-empty lines of the response as they arrive, for streaming APIs."""
+        with span(f"http.{self.name}", streamed=True) as current:
+            with self._post(url, payload, headers, timeout, current, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if line:
+                        yield line
+
+
+_clients_lock = threading.Lock()
+_clients = {}
+
+
+def get_http_client(name, **settings):
+    """Return the process-wide client for an upstream, creating it with the given settings on first use."""
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = HttpClient(name, **settings)
+        return _clients[name]
@@ -0,0 +1,103 @@
+"""Intent detection for a prompt in one pass.
+
+The prompt is normalised once and every keyword set (Angel and Devil triggers,
+transport, informational, PSLE and vague phrasings...) is matched by a single
+compiled Aho-Corasick automaton, while the school name index picks out the
+schools it mentions. The result is an Intent with the matched labels and slots
+such as the transport destination, so later stages read the intent instead of
+scanning the prompt again.
+"""
+from functools import lru_cache
+
+from text_utils import PhraseMatcher, normalise_text
+from transport import locate_school_mentions
+
+# Words that refer back to the school being discussed, e.g. "which bus goes there?"
+REFERRING_WORDS = {"it", "there", "that", "this", "school", "place"}
+# Words around a destination that are not part of its name
+FILLER_WORDS = {"go", "goes", "going", "get", "gets", "reach", "travel", "to", "the", "a", "an", "please",
+                "lah", "leh", "ah"}
+
+
+# Function to read the destination from the words after a transport phrase, for the fuzzy lookup.
+# Returns None when they only refer back to an earlier school ("goes there", "to the school")
+def destination_text(trailing):
+    words = [word for word in trailing.split() if word not in FILLER_WORDS]
+    if not words or all(word in REFERRING_WORDS for word in words):
+        return None
+    return " ".join(words)
+
+
+class Intent:
+    """Keyword sets a prompt matched ("labels"), the schools it names and slots filled from them."""
+
+    def __init__(self, prompt, normalised, matches, schools, slots):
+        self.prompt = prompt
+        self.normalised = normalised
+        # (start, phrase, label) for every keyword found, in order of appearance
+        self.matches = matches
+        self.labels = {label for _, _, label in matches}
+        self.schools = schools
+        self.slots = slots
+
+    def has(self, label):
+        return label in self.labels
+
+    @property
+    def vague(self):
+        """True for an open-ended opener ("how do I start?") that names nothing more specific."""
+        return self.labels == {"vague"} and not self.schools
+
+    def to_dict(self):
+        return {"labels": sorted(self.labels), "schools": self.schools, "slots": self.slots}
+
+
+class IntentEngine:
+    """Compiled matcher over labelled keyword sets; sets in prefix_labels also match longer word forms."""
+
+    def __init__(self, keyword_sets, prefix_labels=()):
+        self.matcher = PhraseMatcher(
+            phrases=[(keyword, label) for label, keywords in keyword_sets.items() if label not in prefix_labels
+                     for keyword in keywords],
+            prefixes=[(keyword, label) for label, keywords in keyword_sets.items() if label in prefix_labels
+                      for keyword in keywords],
+        )
+
+    def detect(self, prompt, recent_schools=()):
+        """Return the Intent of a prompt; recent_schools (oldest first) fill slots a follow-up leaves out."""
+        normalised = normalise_text(prompt)
+        matches = self.matcher.find(normalised)
+        located = locate_school_mentions(normalised)
+        schools = [school_name for _, school_name in located]
+        slots = {}
+        if schools:
+            slots["school"] = schools[0]
+
+        transport_ends = [start + len(phrase) for start, phrase, label in matches if label == "transport"]
+        if transport_ends:
+            # The destination is named after "bus to", "how do I get to"..., but before any "from ..." origin
+            phrase_end = transport_ends[0]
+            origin = normalised.find(" from ", phrase_end)
+            destination_end = origin if origin != -1 else len(normalised)
+            after = [school_name for start, school_name in located if phrase_end <= start < destination_end]
+            before = [school_name for start, school_name in located if start < phrase_end]
+            # Otherwise the words there, which may be a misspelt name for the fuzzy lookup, then a school
+            # named earlier in the prompt, then the last one discussed ("how do I get there?")
+            destination = after[0] if after else destination_text(normalised[phrase_end:destination_end])
+            if destination is None and before:
+                destination = before[0]
+            if destination is None and recent_schools:
+                destination = recent_schools[-1]
+            slots["destination"] = destination
+        return Intent(prompt, normalised, matches, schools, slots)
+
+
+@lru_cache(maxsize=8)
+def _get_intent_engine(keyword_sets, prefix_labels):
+    return IntentEngine({label: list(keywords) for label, keywords in keyword_sets}, prefix_labels)
+
+
+def get_intent_engine(keyword_sets, prefix_labels=()):
+    """Return the process-wide engine for these keyword sets, compiled on first use."""
+    frozen_sets = tuple(sorted((label, tuple(keywords)) for label, keywords in keyword_sets.items()))
+    return _get_intent_engine(frozen_sets, tuple(sorted(prefix_labels)))
@@ -0,0 +1,175 @@
+"""Bounded conversation memory for the chat agents.
+
+The most recent turns are kept verbatim within a token budget. Older turns are
+folded, one at a time as they leave the window, into a short running summary
+that also remembers which schools have been discussed, so follow-ups such as
+"what about its CCAs?" still reach the model with the context they refer to.
+Each agent gets its own compact view: its own earlier replies in full and the
+other agents' replies clipped.
+"""
+import re
+
+from transport import find_school_mentions
+
+DEFAULT_WINDOW_TOKENS = 1200
+DEFAULT_SUMMARY_TOKENS = 300
+DEFAULT_MAX_MESSAGES = 60
+# Longest excerpt of a turn kept in the running summary, and of another agent's reply in the window
+SUMMARY_EXCERPT_CHARS = 160
+OTHER_AGENT_EXCERPT_CHARS = 300
+# Schools remembered for resolving follow-up questions
+MAX_REMEMBERED_SCHOOLS = 5
+# Longest school name or agent role kept from a restored memory
+MAX_NAME_CHARS = 80
+
+
+class MemoryStateError(ValueError):
+    """Raised when a memory state handed back by a client is not in the form to_dict() produces."""
+
+
+# Function to estimate OpenAI tokens without a tokenizer, at about four characters per token
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# Function to shorten a reply to its first sentence, cut at a word boundary if still too long
+def clip(text, limit):
+    text = " ".join(text.split())
+    first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first_sentence) <= limit:
+        return first_sentence
+    return first_sentence[:limit].rsplit(" ", 1)[0] + "..."
+
+
+def _is_text_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _is_turn(turn):
+    if not isinstance(turn, dict) or not isinstance(turn.get("prompt"), str):
+        return False
+    replies = turn.get("replies", {})
+    return isinstance(replies, dict) and _is_text_list(list(replies.values()))
+
+
+def agent_role(agent_name):
+    """Chat message role used for an agent's replies, e.g. "Angel" -> "Angel Bot"."""
+    return f"{agent_name} Bot"
+
+
+class ConversationMemory:
+    """Rolling window of recent turns plus a running summary of older ones, kept per session."""
+
+    def __init__(self, window_tokens=DEFAULT_WINDOW_TOKENS, summary_tokens=DEFAULT_SUMMARY_TOKENS):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        # Each turn is {"prompt": str, "replies": {role: content}}
+        self.turns = []
+        self.summary_lines = []
+        self.schools = []
+
+    def __len__(self):
+        return len(self.turns)
+
+    def to_dict(self):
+        """Plain JSON-serialisable state, so a memory can live in a session or travel with an API request."""
+        return {"turns": self.turns, "summary_lines": self.summary_lines, "schools": self.schools}
+
+    @classmethod
+    def from_dict(cls, state, **budgets):
+        """Rebuild a memory from to_dict() state, trimmed to this memory's budgets.
+
+        The state may come from a client, so it is checked and cut down like a memory built
+        turn by turn; raises MemoryStateError when it is not in the form to_dict() produces.
+        """
+        memory = cls(**budgets)
+        state = state or {}
+        if not isinstance(state, dict):
+            raise MemoryStateError("memory must be an object")
+        turns = state.get("turns", [])
+        if not isinstance(turns, list) or not all(_is_turn(turn) for turn in turns):
+            raise MemoryStateError("memory turns must be a list of {prompt, replies} with text values")
+        for field in ("summary_lines", "schools"):
+            if not _is_text_list(state.get(field, [])):
+                raise MemoryStateError(f"memory {field} must be a list of text")
+
+        # No single text may be longer than the whole budget it counts against
+        turn_chars = memory.window_tokens * 4
+        memory.turns = [{"prompt": turn["prompt"][:turn_chars],
+                         "replies": {role[:MAX_NAME_CHARS]: reply[:turn_chars]
+                                     for role, reply in turn.get("replies", {}).items()}}
+                        for turn in turns]
+        memory.summary_lines = [line[:memory.summary_tokens * 4] for line in state.get("summary_lines", [])]
+        memory.schools = [name[:MAX_NAME_CHARS] for name in state.get("schools", [])]
+        memory._fit_budgets()
+        return memory
+
+    @staticmethod
+    def _turn_tokens(turn):
+        return estimate_tokens(turn["prompt"]) + sum(estimate_tokens(reply) for reply in turn["replies"].values())
+
+    def add_turn(self, prompt, messages):
+        """Remember a finished turn; messages are the chat messages the agents replied with."""
+        turn = {"prompt": prompt, "replies": {message["role"]: message["content"] for message in messages}}
+        self.turns.append(turn)
+        for school_name in find_school_mentions(prompt):
+            if school_name in self.schools:
+                self.schools.remove(school_name)
+            self.schools.append(school_name)
+        self._fit_budgets()
+
+    def _fit_budgets(self):
+        del self.schools[:-MAX_REMEMBERED_SCHOOLS]
+        # Fold the oldest turns into the summary until the window fits its budget again
+        while len(self.turns) > 1 and sum(self._turn_tokens(kept) for kept in self.turns) > self.window_tokens:
+            self._summarise(self.turns.pop(0))
+        self._trim_summary()
+
+    def _summarise(self, turn):
+        parts = [f"Student asked: {clip(turn['prompt'], SUMMARY_EXCERPT_CHARS)}"]
+        parts += [f"{role.replace(' Bot', '')} said: {clip(reply, SUMMARY_EXCERPT_CHARS)}"
+                  for role, reply in turn["replies"].items()]
+        self.summary_lines.append("- " + "; ".join(parts))
+        self._trim_summary()
+
+    def _trim_summary(self):
+        while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > self.summary_tokens:
+            self.summary_lines.pop(0)
+
+    def summary(self):
+        lines = []
+        if self.schools:
+            lines.append(f"Schools discussed so far (most recent last): {', '.join(name.title() for name in self.schools)}")
+        return "\n".join(lines + self.summary_lines)
+
+    def context_messages(self, agent_name, token_budget=None):
+        """Return the chat messages that give an agent the conversation so far, oldest first."""
+        token_budget = self.window_tokens if token_budget is None else token_budget
+        own_role = agent_role(agent_name)
+        window = []
+        used = 0
+        # Newest turns are kept first, so the budget drops the oldest ones
+        for turn in reversed(self.turns):
+            messages = [{"role": "user", "content": turn["prompt"]}]
+            for role, reply in turn["replies"].items():
+                if role == own_role:
+                    messages.append({"role": "assistant", "content": reply})
+                else:
+                    name = role.replace(" Bot", "")
+                    messages.append({"role": "system", "content": f"{name} replied: {clip(reply, OTHER_AGENT_EXCERPT_CHARS)}"})
+            tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            if window and used + tokens > token_budget:
+                break
+            window[:0] = messages
+            used += tokens
+
+        summary = self.summary()
+        if summary:
+            window.insert(0, {"role": "system", "content": f"Earlier in this conversation:\n{summary}"})
+        return window
+
+    def expand_query(self, prompt):
+        """Add the most recently discussed school to a prompt that names none, for local retrieval."""
+        if self.schools and not find_school_mentions(prompt):
+            return f"{prompt} {self.schools[-1].title()}"
+        return prompt
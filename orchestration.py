@@ -0,0 +1,66 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Default settings for running several agent generations at once
+DEFAULT_MAX_CONCURRENCY = 3
+DEFAULT_CALL_TIMEOUT = 30.0
+
+
+class GenerationTimeout(Exception):
+    """Raised in place of a stream that did not finish within its timeout."""
+
+
+# Function to run several streaming jobs on a thread pool and merge their output.
+# Each job is a zero-argument callable returning an iterable of text chunks.
+# Yields (key, "chunk", text) as output arrives, then (key, "error", exception)
+# if the job failed or timed out, and finally (key, "done", None) for every job.
+def run_streams(jobs, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_CALL_TIMEOUT):
+    events = queue.Queue()
+    started = {}
+    finished = set()
+    lock = threading.Lock()
+
+    def worker(key, job):
+        with lock:
+            started[key] = time.monotonic()
+        try:
+            for chunk in job():
+                if key in finished:
+                    return  # Timed out, nobody is listening any more
+                events.put((key, "chunk", chunk))
+        except Exception as e:
+            events.put((key, "error", e))
+        finally:
+            events.put((key, "done", None))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="generation")
+    try:
+        for key, job in jobs.items():
+            # Run each job in a copy of the caller's context so tracing spans attach to the current turn
+            pool.submit(contextvars.copy_context().run, worker, key, job)
+
+        while len(finished) < len(jobs):
+            try:
+                key, kind, value = events.get(timeout=0.1)
+            except queue.Empty:
+                key = kind = None
+
+            if key is not None and key not in finished:
+                if kind == "done":
+                    finished.add(key)
+                yield key, kind, value
+
+            # Give up on jobs that have been running for longer than the per-call timeout
+            now = time.monotonic()
+            with lock:
+                overdue = [k for k, start in started.items() if k not in finished and now - start > timeout]
+            for overdue_key in overdue:
+                finished.add(overdue_key)
+                yield overdue_key, "error", GenerationTimeout(f"No complete response within {timeout:.0f}s")
+                yield overdue_key, "done", None
+    finally:
+        # Do not block the Streamlit script on workers that are still winding down
+        pool.shutdown(wait=False, cancel_futures=True)
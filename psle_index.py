@@ -0,0 +1,181 @@
+"""PSLE knowledge index built from psle_infosheet.pdf.
+
+Run ``python psle_index.py`` at build time to extract, chunk and index the PDF.
+The index is only rebuilt when the PDF's hash changes. At runtime the postings
+file is memory-mapped, so answering a PSLE question is a local BM25 lookup.
+"""
+import array
+import hashlib
+import json
+import math
+import mmap
+import os
+import threading
+from collections import Counter
+
+from config import CACHE_DIR, atomic_write
+from resources import lazy_import
+from text_utils import normalise_text
+
+PSLE_PDF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "psle_infosheet.pdf")
+PSLE_INDEX_DIR = os.path.join(CACHE_DIR, "psle_index")
+PSLE_META_PATH = os.path.join(PSLE_INDEX_DIR, "meta.json")
+PSLE_POSTINGS_PATH = os.path.join(PSLE_INDEX_DIR, "postings.bin")
+# Bump when the artifact layout or tokenisation changes to force a rebuild
+PSLE_INDEX_VERSION = 1
+
+# Chunking and ranking settings
+CHUNK_WORDS = 90
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "my", "of", "on", "or", "the", "this", "to", "what", "will", "with", "you", "your",
+}
+
+
+# Function to split text into index terms, with a light plural stemmer
+def tokenise(text):
+    terms = []
+    for word in normalise_text(text).split():
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+# Function to hash the PDF so the index is only rebuilt when it changes
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as pdf_file:
+        for block in iter(lambda: pdf_file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to extract text blocks from the PDF and merge them into chunks of about CHUNK_WORDS words
+def extract_chunks(pdf_path=PSLE_PDF_PATH):
+    fitz = lazy_import("fitz")  # PyMuPDF, only needed when (re)building the index
+
+    chunks = []
+    with fitz.open(pdf_path) as document:
+        for page_number, page in enumerate(document, start=1):
+            current = []
+            for block in page.get_text("blocks"):
+                text = " ".join(block[4].split())
+                if not text:
+                    continue
+                current.append(text)
+                if sum(len(part.split()) for part in current) >= CHUNK_WORDS:
+                    chunks.append({"page": page_number, "text": " ".join(current)})
+                    current = []
+            if current:
+                chunks.append({"page": page_number, "text": " ".join(current)})
+    return chunks
+
+
+def is_index_current(pdf_path=PSLE_PDF_PATH):
+    """Return True when the stored index was built from this exact PDF."""
+    try:
+        with open(PSLE_META_PATH, "r", encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return False
+    return (
+        meta.get("version") == PSLE_INDEX_VERSION
+        and meta.get("pdf_sha256") == file_sha256(pdf_path)
+        and os.path.exists(PSLE_POSTINGS_PATH)
+    )
+
+
+def build_psle_index(pdf_path=PSLE_PDF_PATH, force=False):
+    """Extract, chunk and index the PDF, skipping the work when the PDF is unchanged."""
+    if not force and is_index_current(pdf_path):
+        return False
+
+    chunks = extract_chunks(pdf_path)
+    term_frequencies = [Counter(tokenise(chunk["text"])) for chunk in chunks]
+
+    # Inverted index: per term, a run of (chunk id, term frequency) pairs packed as uint32
+    postings = {}
+    for chunk_id, frequencies in enumerate(term_frequencies):
+        for term, frequency in frequencies.items():
+            postings.setdefault(term, []).extend((chunk_id, frequency))
+
+    terms = {}
+    packed = array.array("I")
+    for term in sorted(postings):
+        terms[term] = [len(packed), len(postings[term]) // 2]
+        packed.extend(postings[term])
+
+    # Builds of the same PDF are identical, so a reader never pairs mismatched files
+    atomic_write(PSLE_POSTINGS_PATH, packed.tofile, binary=True)
+    meta = {
+        "version": PSLE_INDEX_VERSION,
+        "pdf_sha256": file_sha256(pdf_path),
+        "chunks": chunks,
+        "lengths": [sum(frequencies.values()) for frequencies in term_frequencies],
+        "terms": terms,
+    }
+    atomic_write(PSLE_META_PATH, lambda meta_file: json.dump(meta, meta_file))
+    return True
+
+
+class PsleIndex:
+    """Read-only BM25 index over the PDF chunks, backed by a memory-mapped postings file."""
+
+    def __init__(self, meta_path=PSLE_META_PATH, postings_path=PSLE_POSTINGS_PATH):
+        with open(meta_path, "r", encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        self.chunks = meta["chunks"]
+        self.lengths = meta["lengths"]
+        self.terms = meta["terms"]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        with open(postings_path, "rb") as postings_file:
+            size = os.fstat(postings_file.fileno()).st_size
+            self._postings = mmap.mmap(postings_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._item_size = array.array("I").itemsize
+
+    def _postings_for(self, term):
+        offset, count = self.terms[term]
+        values = array.array("I")
+        values.frombytes(self._postings[offset * self._item_size:(offset + 2 * count) * self._item_size])
+        return zip(values[0::2], values[1::2])
+
+    def search(self, query, top_k=3):
+        """Return up to top_k (score, chunk) pairs for a query, best first."""
+        scores = Counter()
+        chunk_count = len(self.chunks)
+        for term in set(tokenise(query)):
+            if term not in self.terms:
+                continue
+            document_frequency = self.terms[term][1]
+            idf = math.log(1 + (chunk_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            for chunk_id, frequency in self._postings_for(term):
+                length_norm = 1 - BM25_B + BM25_B * self.lengths[chunk_id] / self.average_length
+                scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in scores.most_common(top_k)]
+
+
+_index_lock = threading.Lock()
+_index = None
+
+
+def get_psle_index():
+    """Return the process-wide PSLE index, building it first if the artifact is missing or stale."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if not is_index_current():
+                build_psle_index()
+            _index = PsleIndex()
+        return _index
+
+
+if __name__ == "__main__":
+    rebuilt = build_psle_index()
+    print("PSLE index rebuilt." if rebuilt else "PSLE index is up to date.")
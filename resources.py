@@ -0,0 +1,61 @@
+import importlib
+import threading
+import time
+
+# Process-wide registry of expensive objects (clients, agents, indexes) and heavy imports.
+# Streamlit re-executes the app script on every interaction, but this module is only
+# imported once per process, so anything held here survives reruns.
+
+_registry_lock = threading.Lock()
+_factories = {}
+_instances = {}
+_locks = {}
+_timings = {}
+_process_started = time.time()
+
+
+def register(name, factory):
+    """Register a factory for a named resource; an existing registration is kept."""
+    with _registry_lock:
+        _factories.setdefault(name, factory)
+        _locks.setdefault(name, threading.Lock())
+
+
+def get(name):
+    """Return the named resource, constructing it on first use."""
+    if name in _instances:
+        return _instances[name]
+    with _registry_lock:
+        lock = _locks[name]
+    with lock:
+        if name not in _instances:
+            started = time.perf_counter()
+            _instances[name] = _factories[name]()
+            _timings[name] = time.perf_counter() - started
+    return _instances[name]
+
+
+def resource(name):
+    """Decorator turning a factory function into a getter for a process-wide singleton."""
+    def decorator(factory):
+        register(name, factory)
+        return lambda: get(name)
+    return decorator
+
+
+def lazy_import(module_name):
+    """Import a heavy module on the code path that needs it, recording how long the first import took."""
+    name = f"import {module_name}"
+    register(name, lambda: importlib.import_module(module_name))
+    return get(name)
+
+
+def startup_report():
+    """Return (name, seconds) for every resource and import constructed so far, slowest first."""
+    return sorted(_timings.items(), key=lambda item: item[1], reverse=True)
+
+
+def format_startup_report():
+    lines = [f"Process up for {time.time() - _process_started:.1f}s"]
+    lines += [f"{name}: {seconds * 1000:.0f} ms" for name, seconds in startup_report()]
+    return "\n".join(lines)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3  # Resolves to pysqlite3 when streamlit_app.py has swapped it in
+import threading
+import time
+
+from config import CACHE_DIR
+from text_utils import char_ngrams, normalise_text
+
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+
+# Defaults, overridable from Streamlit secrets in streamlit_app.py
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+# Minimum cosine similarity between prompts for a cached answer to be reused
+DEFAULT_SIMILARITY = 0.9
+
+
+# Function to embed a prompt as its set of character trigrams
+def embed_prompt(prompt):
+    return char_ngrams(normalise_text(prompt))
+
+
+# Function to pick out the parts of a prompt a reused answer must agree on exactly, such as
+# PSLE scores and postal codes: "my score is 8" and "my score is 28" are near-identical otherwise
+def number_terms(prompt):
+    return frozenset(re.findall(r"\d+", normalise_text(prompt)))
+
+
+# Function to compare two trigram sets with cosine similarity
+def cosine_similarity(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / math.sqrt(len(first) * len(second))
+
+
+class ResponseCache:
+    """SQLite-backed cache of LLM answers, looked up by nearest prompt within an agent and context.
+
+    The context (agent instructions, conversation, retrieved facts) must match
+    exactly; only the student's own prompt is compared by similarity, and an
+    earlier prompt is only reused if key_terms(prompt) is the same for both.
+    Entries expire after ``ttl`` seconds and the least recently used entries are
+    evicted once there are more than ``max_entries``.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 similarity=DEFAULT_SIMILARITY, key_terms=number_terms):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.key_terms = key_terms
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " id INTEGER PRIMARY KEY, bucket TEXT NOT NULL, prompt TEXT NOT NULL, grams TEXT NOT NULL,"
+            " response TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_bucket ON responses (bucket)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+        # In-memory copy of the prompt embeddings so lookups do not touch the disk
+        self._embeddings = {}
+        for entry_id, bucket, prompt, grams, created_at in self._db.execute(
+            "SELECT id, bucket, prompt, grams, created_at FROM responses"
+        ):
+            self._embeddings.setdefault(bucket, {})[entry_id] = (set(json.loads(grams)), self.key_terms(prompt), created_at)
+
+    @staticmethod
+    def bucket_key(agent_name, context):
+        return hashlib.sha256(f"{agent_name}\n{context}".encode("utf-8")).hexdigest()
+
+    def get(self, agent_name, context, prompt):
+        """Return the cached answer for the most similar earlier prompt, or None."""
+        bucket = self.bucket_key(agent_name, context)
+        grams = embed_prompt(prompt)
+        terms = self.key_terms(prompt)
+        oldest_allowed = time.time() - self.ttl
+
+        with self._lock:
+            best_id, best_score = None, self.similarity
+            for entry_id, (entry_grams, entry_terms, created_at) in self._embeddings.get(bucket, {}).items():
+                if created_at < oldest_allowed or entry_terms != terms:
+                    continue
+                score = cosine_similarity(grams, entry_grams)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._db.execute(
+                "UPDATE responses SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), best_id)
+            )
+            self._db.commit()
+            row = self._db.execute("SELECT response FROM responses WHERE id = ?", (best_id,)).fetchone()
+            return row[0] if row else None
+
+    def put(self, agent_name, context, prompt, response):
+        """Store an answer, then drop expired entries and evict down to the size bound."""
+        bucket = self.bucket_key(agent_name, context)
+        grams = embed_prompt(prompt)
+        now = time.time()
+
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO responses (bucket, prompt, grams, response, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (bucket, prompt, json.dumps(sorted(grams)), response, now, now)
+            )
+            self._embeddings.setdefault(bucket, {})[cursor.lastrowid] = (grams, self.key_terms(prompt), now)
+
+            removed = self._db.execute(
+                "SELECT id, bucket FROM responses WHERE created_at < ?", (now - self.ttl,)
+            ).fetchall()
+            overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                removed += self._db.execute(
+                    "SELECT id, bucket FROM responses ORDER BY last_used LIMIT ?", (overflow,)
+                ).fetchall()
+            for entry_id, entry_bucket in removed:
+                self._db.execute("DELETE FROM responses WHERE id = ?", (entry_id,))
+                self._embeddings.get(entry_bucket, {}).pop(entry_id, None)
+            self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters for this process and the number of stored answers."""
+        with self._lock:
+            entries = sum(len(bucket) for bucket in self._embeddings.values())
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_response_cache(**settings):
+    """Return the process-wide response cache, creating it with the given settings on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(**settings)
+        return _cache
@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from text_utils import char_ngrams, normalise_text
+
+# Scores at or above this are treated as a confident match without asking the LLM
+CONFIDENT_MATCH = 0.7
+# Scores at or below this are treated as a confident non-match
+CONFIDENT_MISMATCH = 0.35
+# Number of prompt verdicts remembered per router
+VERDICT_CACHE_SIZE = 4096
+
+
+class PromptRouter:
+    """Lexical similarity index over trigger phrases and intent keyword lists.
+
+    Each phrase is compared with the prompt by exact containment first and then
+    by character-trigram similarity against word windows of the prompt, which
+    tolerates typos and small rewordings ("not sure lah", "pro and cons").
+    """
+
+    def __init__(self, trigger_phrases, keyword_sets):
+        self.trigger_phrases = [self._compile(phrase) for phrase in trigger_phrases]
+        self.keyword_sets = {
+            label: [self._compile(keyword) for keyword in keywords]
+            for label, keywords in keyword_sets.items()
+        }
+        self._window_sizes = {
+            size
+            for phrases in [self.trigger_phrases, *self.keyword_sets.values()]
+            for _, word_count, _ in phrases
+            for size in (word_count - 1, word_count, word_count + 1)
+        }
+        self._verdicts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compile(phrase):
+        normalised = normalise_text(phrase)
+        return normalised, len(normalised.split()), char_ngrams(normalised)
+
+    @staticmethod
+    def _best_score(normalised_prompt, prompt_windows, phrases):
+        best = 0.0
+        padded_prompt = f" {normalised_prompt} "
+        for phrase, word_count, phrase_grams in phrases:
+            if f" {phrase} " in padded_prompt:
+                return 1.0
+            # Dice similarity against prompt windows of about the phrase's length
+            for size in (word_count - 1, word_count, word_count + 1):
+                for window_grams in prompt_windows.get(size, ()):
+                    overlap = len(phrase_grams & window_grams)
+                    if overlap:
+                        best = max(best, 2 * overlap / (len(phrase_grams) + len(window_grams)))
+        return best
+
+    @staticmethod
+    def _windows(normalised_prompt, sizes):
+        words = normalised_prompt.split()
+        windows = {}
+        for size in sizes:
+            if 0 < size <= len(words):
+                windows[size] = [
+                    char_ngrams(" ".join(words[start:start + size]))
+                    for start in range(len(words) - size + 1)
+                ]
+        return windows
+
+    def scores(self, prompt):
+        """Return the trigger score and the score of every keyword set for a prompt."""
+        normalised_prompt = normalise_text(prompt)
+        prompt_windows = self._windows(normalised_prompt, self._window_sizes)
+        result = {"angel_and_devil": self._best_score(normalised_prompt, prompt_windows, self.trigger_phrases)}
+        for label, phrases in self.keyword_sets.items():
+            result[label] = self._best_score(normalised_prompt, prompt_windows, phrases)
+        return result
+
+    def wants_angel_and_devil(self, prompt, llm_fallback=None):
+        """Decide whether a prompt asks for the Angel and Devil, asking the LLM only when unsure.
+
+        llm_fallback returns True or False, or None when it could not decide (e.g. the API
+        call failed); that counts as False for this prompt only and is asked again next time.
+        """
+        key = normalise_text(prompt)
+        with self._lock:
+            if key in self._verdicts:
+                self._verdicts.move_to_end(key)
+                return self._verdicts[key]
+
+        scores = self.scores(prompt)
+        trigger_score = scores.pop("angel_and_devil")
+        if trigger_score >= CONFIDENT_MATCH:
+            verdict = True
+        elif trigger_score <= CONFIDENT_MISMATCH:
+            verdict = False
+        elif any(score >= CONFIDENT_MATCH for score in scores.values()):
+            # A clear transport/informational/PSLE question is not a request for opinions
+            verdict = False
+        elif llm_fallback is not None:
+            verdict = llm_fallback(prompt)
+            if verdict is None:
+                return False
+            verdict = bool(verdict)
+        else:
+            verdict = False
+
+        with self._lock:
+            self._verdicts[key] = verdict
+            if len(self._verdicts) > VERDICT_CACHE_SIZE:
+                self._verdicts.popitem(last=False)
+        return verdict
+
+
+@lru_cache(maxsize=8)
+def _get_router(trigger_phrases, keyword_sets):
+    return PromptRouter(trigger_phrases, {label: list(keywords) for label, keywords in keyword_sets})
+
+
+def get_router(trigger_phrases, keyword_sets):
+    """Return the process-wide router for these phrase lists so verdicts survive Streamlit reruns."""
+    frozen_sets = tuple(sorted((label, tuple(keywords)) for label, keywords in keyword_sets.items()))
+    return _get_router(tuple(trigger_phrases), frozen_sets)
@@ -0,0 +1,298 @@
+"""Local copy of the data.gov.sg school collection.
+
+``python school_data.py`` (or the background refresh in the app) pulls every
+dataset in collection 457 through the shared data.gov.sg client and stores each one as a
+dictionary-encoded columnar .npz file. Later syncs only download datasets whose
+metadata changed, using ETag/Last-Modified and the dataset's lastUpdatedAt.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config import CACHE_DIR, atomic_write
+from http_client import get_http_client
+
+SCHOOL_COLLECTION_ID = 457
+# Base URLs can be pointed at local stand-ins, e.g. by benchmarks/run_benchmark.py
+DATA_GOV_SG_API_URL = os.environ.get("DATA_GOV_SG_API_URL", "https://api-production.data.gov.sg").rstrip("/")
+DATA_GOV_SG_URL = os.environ.get("DATA_GOV_SG_URL", "https://data.gov.sg").rstrip("/")
+COLLECTION_METADATA_URL = DATA_GOV_SG_API_URL + "/v2/public/api/collections/{collection_id}/metadata"
+DATASET_METADATA_URL = DATA_GOV_SG_API_URL + "/v2/public/api/datasets/{dataset_id}/metadata"
+DATASTORE_SEARCH_URL = DATA_GOV_SG_URL + "/api/action/datastore_search"
+PAGE_SIZE = 5000
+
+SCHOOL_DATA_DIR = os.path.join(CACHE_DIR, "school_data")
+MANIFEST_PATH = os.path.join(SCHOOL_DATA_DIR, "manifest.json")
+# Check data.gov.sg for changed datasets after this many seconds
+SCHOOL_DATA_TTL = int(os.environ.get("SCHOOL_DATA_TTL", 24 * 60 * 60))
+SYNC_WORKERS = 4
+# Minimum wait between download attempts while there is no local copy at all
+FIRST_SYNC_BACKOFF = 60
+
+
+# Full dataset pages can take a while to arrive, so reads get longer than the client default
+DATASTORE_TIMEOUT = (3.05, 60)
+
+
+# Function to return the shared, pooled and retrying client for data.gov.sg
+def get_data_gov_client():
+    return get_http_client("data_gov_sg", pool_size=SYNC_WORKERS * 2)
+
+
+class Dataset:
+    """One dataset stored column by column, with each column dictionary-encoded."""
+
+    def __init__(self, name, columns):
+        self.name = name
+        # column -> (codes, values): row i holds values[codes[i]]
+        self.columns = columns
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        codes, _ = next(iter(self.columns.values()))
+        return len(codes)
+
+    @classmethod
+    def from_records(cls, name, records):
+        column_names = []
+        for record in records:
+            for column in record:
+                if column != "_id" and column not in column_names:
+                    column_names.append(column)
+
+        columns = {}
+        for column in column_names:
+            raw = ["" if record.get(column) is None else str(record.get(column)) for record in records]
+            values, codes = np.unique(np.array(raw, dtype=str), return_inverse=True)
+            code_type = np.uint16 if len(values) <= np.iinfo(np.uint16).max else np.uint32
+            columns[column] = (codes.astype(code_type), values)
+        return cls(name, columns)
+
+    def column(self, name):
+        """Return a decoded column as a NumPy string array, or None if the dataset lacks it."""
+        if name not in self.columns:
+            return None
+        codes, values = self.columns[name]
+        return values[codes]
+
+    def records(self):
+        """Decode every row into a dict, for code that needs row access."""
+        decoded = {name: self.column(name).tolist() for name in self.columns}
+        return [dict(zip(decoded, row)) for row in zip(*decoded.values())]
+
+    def save(self, path):
+        arrays = {}
+        for column, (codes, values) in self.columns.items():
+            arrays[f"{column}.codes"] = codes
+            arrays[f"{column}.values"] = values
+        atomic_write(path, lambda npz_file: np.savez_compressed(npz_file, **arrays), binary=True)
+
+    @classmethod
+    def load(cls, name, path):
+        columns = {}
+        with np.load(path, allow_pickle=False) as stored:
+            for key in stored.files:
+                column, part = key.rsplit(".", 1)
+                columns.setdefault(column, [None, None])[0 if part == "codes" else 1] = stored[key]
+        return cls(name, {column: tuple(pair) for column, pair in columns.items()})
+
+
+class SchoolTable:
+    """All datasets of the school collection, held in memory."""
+
+    def __init__(self, datasets, synced_at=0):
+        self.datasets = datasets
+        self.synced_at = synced_at
+
+    def find(self, column):
+        """Return the first dataset that has the given column, e.g. "bus_desc" for general information."""
+        for dataset in self.datasets.values():
+            if column in dataset.columns:
+                return dataset
+        return None
+
+    def records(self):
+        """Return the rows of every dataset, for code that merges them per school."""
+        rows = []
+        for dataset in self.datasets.values():
+            rows.extend(dataset.records())
+        return rows
+
+    def summary(self):
+        return [
+            {"dataset": dataset.name, "rows": len(dataset), "columns": len(dataset.columns)}
+            for dataset in self.datasets.values()
+        ]
+
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {"datasets": {}, "synced_at": 0}
+
+
+def _save_manifest(manifest):
+    atomic_write(MANIFEST_PATH, lambda manifest_file: json.dump(manifest, manifest_file, indent=2))
+
+
+def _dataset_path(dataset_id):
+    return os.path.join(SCHOOL_DATA_DIR, f"{dataset_id}.npz")
+
+
+# Function to download all rows of a dataset from the datastore API
+def _fetch_records(client, dataset_id):
+    records = []
+    offset = 0
+    while True:
+        params = {"resource_id": dataset_id, "limit": PAGE_SIZE, "offset": offset}
+        result = client.get_json(DATASTORE_SEARCH_URL, params=params, timeout=DATASTORE_TIMEOUT).get("result", {})
+        page = result.get("records", [])
+        records.extend(page)
+        offset += len(page)
+        if not page or offset >= result.get("total", 0):
+            return records
+
+
+# Function to sync one dataset, downloading it only when its metadata says it changed
+def _sync_dataset(client, dataset_id, previous):
+    headers = {}
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+
+    response = client.get(DATASET_METADATA_URL.format(dataset_id=dataset_id), headers=headers)
+    metadata = {}
+    unchanged = response.status_code == 304
+    if not unchanged:
+        response.raise_for_status()
+        metadata = response.json().get("data", {})
+        unchanged = bool(previous.get("last_updated_at")) and metadata.get("lastUpdatedAt") == previous["last_updated_at"]
+    if unchanged and os.path.exists(_dataset_path(dataset_id)):
+        return dict(previous, changed=False)
+
+    name = metadata.get("name") or previous.get("name") or dataset_id
+    dataset = Dataset.from_records(name, _fetch_records(client, dataset_id))
+    dataset.save(_dataset_path(dataset_id))
+    return {
+        "name": dataset.name,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "last_updated_at": metadata.get("lastUpdatedAt", previous.get("last_updated_at")),
+        "rows": len(dataset),
+        "changed": True,
+    }
+
+
+def sync_school_data(collection_id=SCHOOL_COLLECTION_ID):
+    """Bring the local copy of the collection up to date and return the per-dataset results."""
+    manifest = _load_manifest()
+    client = get_data_gov_client()
+    metadata = client.get_json(COLLECTION_METADATA_URL.format(collection_id=collection_id))
+    dataset_ids = metadata.get("data", {}).get("collectionMetadata", {}).get("childDatasets", [])
+
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as pool:
+        futures = {
+            dataset_id: pool.submit(_sync_dataset, client, dataset_id, manifest["datasets"].get(dataset_id, {}))
+            for dataset_id in dataset_ids
+        }
+
+    datasets = {}
+    for dataset_id, future in futures.items():
+        try:
+            datasets[dataset_id] = future.result()
+        except Exception as e:
+            print(f"Error syncing school dataset {dataset_id}: {e}")
+            if dataset_id in manifest["datasets"]:
+                datasets[dataset_id] = dict(manifest["datasets"][dataset_id], changed=False)
+
+    # Datasets dropped from the collection are removed locally as well
+    for dataset_id in set(manifest["datasets"]) - set(datasets):
+        try:
+            os.remove(_dataset_path(dataset_id))
+        except OSError:
+            pass
+
+    manifest = {"datasets": datasets, "synced_at": time.time()}
+    _save_manifest(manifest)
+    return manifest
+
+
+# Function to read the local copy of the collection into memory
+def load_school_table():
+    manifest = _load_manifest()
+    datasets = {}
+    for dataset_id, entry in manifest["datasets"].items():
+        try:
+            datasets[dataset_id] = Dataset.load(entry.get("name", dataset_id), _dataset_path(dataset_id))
+        except (OSError, ValueError) as e:
+            print(f"Error loading school dataset {dataset_id}: {e}")
+    return SchoolTable(datasets, manifest.get("synced_at", 0))
+
+
+_table_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_table = None
+_listeners = []
+_last_first_sync = 0.0
+_last_background_sync = 0.0
+
+
+def on_school_table_update(listener):
+    """Register a callback run with the new table after every successful refresh."""
+    _listeners.append(listener)
+
+
+def refresh_school_table():
+    """Sync with data.gov.sg and swap in the new table, keeping the old one on failure."""
+    global _table
+    if not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        sync_school_data()
+        table = load_school_table()
+        with _table_lock:
+            _table = table
+        for listener in list(_listeners):
+            try:
+                listener(table)
+            except Exception as e:
+                print(f"Error updating from school data: {e}")
+    except Exception as e:
+        print(f"Error refreshing school data: {e}")
+    finally:
+        _sync_lock.release()
+
+
+def get_school_table():
+    """Return the in-process school table, loading it from disk and refreshing it in the background."""
+    global _table, _last_first_sync, _last_background_sync
+    with _table_lock:
+        if _table is None:
+            _table = load_school_table()
+        table = _table
+
+    if not table.datasets and time.time() - _last_first_sync > FIRST_SYNC_BACKOFF:
+        # Nothing on disk yet, the first caller has to wait for the download
+        _last_first_sync = time.time()
+        refresh_school_table()
+        with _table_lock:
+            table = _table
+    elif time.time() - max(table.synced_at, _last_background_sync) > SCHOOL_DATA_TTL:
+        _last_background_sync = time.time()  # Only one background refresh per TTL window
+        threading.Thread(target=refresh_school_table, daemon=True).start()
+    return table
+
+
+if __name__ == "__main__":
+    result = sync_school_data()
+    for dataset_id, entry in result["datasets"].items():
+        status = "updated" if entry.get("changed") else "unchanged"
+        print(f"{dataset_id}: {entry.get('name')} ({entry.get('rows')} rows, {status})")
@@ -0,0 +1,257 @@
+import re
+import threading
+
+import numpy as np
+
+from geo_index import haversine_km
+from geocode import geocode, geocode_many
+from school_data import get_school_table, on_school_table_update
+from school_store import load_school_profiles
+from text_utils import normalise_text
+
+ZONES = ("north", "south", "east", "west", "central")
+
+# Relative weight of each scoring component; components the student did not ask about are skipped
+SCORE_WEIGHTS = {"academic_fit": 3.0, "proximity": 2.0, "ccas": 1.5, "programmes": 1.5, "affiliations": 2.0}
+# Distance at which the proximity score reaches zero
+PROXIMITY_RANGE_KM = 15.0
+# How many AL points above the student's score a school's cut-off can be before fit reaches zero
+ACADEMIC_FIT_RANGE = 10.0
+
+
+# Function to turn per-school lists (CCAs, programmes) into a boolean school x value matrix
+def _membership_matrix(profiles, field):
+    vocabulary = sorted({normalise_text(value) for profile in profiles for value in profile.get(field, [])})
+    columns = {value: position for position, value in enumerate(vocabulary)}
+    matrix = np.zeros((len(profiles), len(vocabulary)), dtype=bool)
+    for row, profile in enumerate(profiles):
+        for value in profile.get(field, []):
+            matrix[row, columns[normalise_text(value)]] = True
+    return matrix, columns
+
+
+class SchoolQueryEngine:
+    """Column arrays over every secondary school for vectorised filtering and ranking."""
+
+    def __init__(self, profiles, coordinates=None):
+        coordinates = coordinates or {}
+        # Sorted by name so ties are always broken the same way
+        self.profiles = sorted(profiles, key=lambda profile: profile["school_name"])
+        self.names = np.array([profile["school_name"] for profile in self.profiles], dtype=str)
+        self.al_min = np.array([profile.get("al_min", np.nan) for profile in self.profiles], dtype=float)
+        self.al_max = np.array([profile.get("al_max", np.nan) for profile in self.profiles], dtype=float)
+        self.zones = np.array([profile.get("zone", "").lower() for profile in self.profiles], dtype=str)
+        self.positions = {normalise_text(name): position for position, name in enumerate(self.names)}
+
+        points = [coordinates.get(profile.get("postal_code")) or (np.nan, np.nan) for profile in self.profiles]
+        self.lats = np.array([point[0] for point in points], dtype=float)
+        self.lons = np.array([point[1] for point in points], dtype=float)
+
+        self.ccas, self.cca_columns = _membership_matrix(self.profiles, "ccas")
+        self.programmes, self.programme_columns = _membership_matrix(self.profiles, "programmes")
+        self.affiliations, self.affiliation_columns = _membership_matrix(self.profiles, "affiliations")
+
+    def __len__(self):
+        return len(self.profiles)
+
+    # Function to find the vocabulary entries a free-text wish refers to, e.g. "robotics" -> "robotics club"
+    @staticmethod
+    def _resolve(wishes, columns):
+        matched = []
+        for wish in wishes:
+            wish = normalise_text(wish)
+            matched.extend(position for value, position in columns.items() if wish and wish in value)
+        return sorted(set(matched))
+
+    @staticmethod
+    def _share_matched(matrix, resolved, wished_count):
+        if not resolved:
+            return np.zeros(matrix.shape[0])
+        return np.minimum(matrix[:, resolved].sum(axis=1) / wished_count, 1.0)
+
+    def _score(self, al_score=None, zones=(), home=None, max_distance_km=None,
+               ccas=(), programmes=(), affiliations=()):
+        """Score every school at once; returns (mask of schools passing the filters, scores, distances)."""
+        count = len(self)
+        mask = np.ones(count, dtype=bool)
+        scores = np.zeros(count)
+        total_weight = 0.0
+        distances = np.full(count, np.nan)
+
+        if al_score is not None:
+            mask &= ~(self.al_max < al_score)
+            headroom = np.clip((self.al_max - al_score) / ACADEMIC_FIT_RANGE, 0.0, 1.0)
+            scores += SCORE_WEIGHTS["academic_fit"] * np.where(np.isnan(headroom), 0.5, 1.0 - headroom)
+            total_weight += SCORE_WEIGHTS["academic_fit"]
+
+        if zones:
+            mask &= np.isin(self.zones, [zone.lower() for zone in zones])
+
+        if home is not None:
+            distances = haversine_km(home[0], home[1], self.lats, self.lons)
+            if max_distance_km is not None:
+                mask &= ~(distances > max_distance_km)
+            proximity = 1.0 - np.clip(distances / PROXIMITY_RANGE_KM, 0.0, 1.0)
+            scores += SCORE_WEIGHTS["proximity"] * np.where(np.isnan(proximity), 0.0, proximity)
+            total_weight += SCORE_WEIGHTS["proximity"]
+
+        for field, wishes, matrix, columns in [
+            ("ccas", ccas, self.ccas, self.cca_columns),
+            ("programmes", programmes, self.programmes, self.programme_columns),
+            ("affiliations", affiliations, self.affiliations, self.affiliation_columns),
+        ]:
+            if wishes:
+                resolved = self._resolve(wishes, columns)
+                scores += SCORE_WEIGHTS[field] * self._share_matched(matrix, resolved, len(wishes))
+                total_weight += SCORE_WEIGHTS[field]
+
+        if total_weight:
+            scores /= total_weight
+        return mask, scores, distances
+
+    def _result(self, position, scores, distances, ccas, programmes):
+        return {
+            "school_name": self.profiles[position]["school_name"],
+            "score": round(float(scores[position]), 3),
+            "distance_km": None if np.isnan(distances[position]) else round(float(distances[position]), 1),
+            "al_range": None if np.isnan(self.al_max[position])
+            else f"{int(self.al_min[position])}-{int(self.al_max[position])}",
+            "zone": self.profiles[position].get("zone", ""),
+            "ccas": self._matched_values(position, "ccas", ccas),
+            "programmes": self._matched_values(position, "programmes", programmes),
+        }
+
+    def query(self, al_score=None, zones=(), home=None, max_distance_km=None,
+              ccas=(), programmes=(), affiliations=(), top_k=5):
+        """Filter and rank every school at once, returning the top_k matches best first.
+
+        al_score is the student's PSLE score (4-32, lower is better) and home is a
+        (lat, lon) pair. Schools without cut-off data or coordinates are not
+        excluded by those filters, they just score neutrally on them.
+        """
+        mask, scores, distances = self._score(al_score, zones, home, max_distance_km, ccas, programmes, affiliations)
+        candidates = np.flatnonzero(mask)
+        # Higher score first, then by name; the arrays are name-sorted so a stable sort keeps ties deterministic
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")][:top_k]
+        return [self._result(position, scores, distances, ccas, programmes) for position in ranked]
+
+    def compare(self, school_names, al_score=None, zones=(), home=None, max_distance_km=None,
+                ccas=(), programmes=(), affiliations=()):
+        """Score the named schools for one student in a single pass, keeping the order given.
+
+        Each result is as from query(), plus "eligible": whether the school passes the
+        filters (e.g. its cut-off is within reach of al_score). Unknown names are skipped.
+        """
+        mask, scores, distances = self._score(al_score, zones, home, max_distance_km, ccas, programmes, affiliations)
+        positions = [self.positions.get(normalise_text(name)) for name in school_names]
+        return [
+            dict(self._result(position, scores, distances, ccas, programmes), eligible=bool(mask[position]))
+            for position in positions if position is not None
+        ]
+
+    def _matched_values(self, position, field, wishes):
+        wishes = [normalise_text(wish) for wish in wishes]
+        return [value for value in self.profiles[position].get(field, [])
+                if any(wish and wish in normalise_text(value) for wish in wishes)]
+
+    def criteria_from_prompt(self, prompt):
+        """Pick out the search criteria a free-text question mentions."""
+        normalised = normalise_text(prompt)
+        padded = f" {normalised} "
+        criteria = {}
+
+        score_match = re.search(r"\b(?:al|psle|score|aggregate)\D{0,12}?\b([4-9]|[12][0-9]|3[0-2])\b", normalised)
+        if score_match:
+            criteria["al_score"] = int(score_match.group(1))
+        postal_match = re.search(r"\b(\d{6})\b", normalised)
+        if postal_match:
+            criteria["postal_code"] = postal_match.group(1)
+        distance_match = re.search(r"\b(?:within|under|less than)\s+(\d+(?:\.\d+)?)\s*km\b", prompt.lower())
+        if distance_match:
+            criteria["max_distance_km"] = float(distance_match.group(1))
+
+        zones = [zone for zone in ZONES if f" {zone} " in padded]
+        if zones:
+            criteria["zones"] = zones
+        for field, columns in [("ccas", self.cca_columns), ("programmes", self.programme_columns),
+                               ("affiliations", self.affiliation_columns)]:
+            mentioned = [value for value in columns if len(value) > 3 and f" {value} " in padded]
+            if mentioned:
+                criteria[field] = mentioned
+        return criteria
+
+
+_engine_lock = threading.Lock()
+_engine = None
+
+
+# Function to rebuild the engine from the school table, using cached school coordinates
+def _rebuild_engine(table):
+    profiles = list(load_school_profiles(table).values())
+    postal_codes = [profile.get("postal_code") for profile in profiles]
+    engine = _install_engine(profiles, geocode_many(postal_codes, offline=True))
+
+    # Geocode schools not seen before in the background, then rebuild with their coordinates
+    if len(engine) and np.isnan(engine.lats).any():
+        threading.Thread(
+            target=lambda: _install_engine(profiles, geocode_many(postal_codes)), daemon=True
+        ).start()
+
+
+def _install_engine(profiles, coordinates):
+    global _engine
+    engine = SchoolQueryEngine(profiles, coordinates)
+    with _engine_lock:
+        _engine = engine
+    return engine
+
+
+on_school_table_update(_rebuild_engine)
+
+
+def get_query_engine():
+    """Return the process-wide query engine built from the local school table."""
+    table = get_school_table()
+    with _engine_lock:
+        if _engine is not None:
+            return _engine
+    _rebuild_engine(table)
+    return _engine
+
+
+def recommend_schools(prompt, top_k=5):
+    """Rank schools for the criteria mentioned in a prompt; returns (criteria, results)."""
+    engine = get_query_engine()
+    criteria = engine.criteria_from_prompt(prompt)
+    if not criteria:
+        return criteria, []
+
+    home = geocode(criteria["postal_code"]) if criteria.get("postal_code") else None
+    results = engine.query(
+        al_score=criteria.get("al_score"),
+        zones=criteria.get("zones", ()),
+        home=home,
+        max_distance_km=criteria.get("max_distance_km"),
+        ccas=criteria.get("ccas", ()),
+        programmes=criteria.get("programmes", ()),
+        affiliations=criteria.get("affiliations", ()),
+        top_k=top_k,
+    )
+    return criteria, results
+
+
+# Function to render ranked schools as grounding text for the agents
+def format_recommendations(results):
+    lines = []
+    for rank, result in enumerate(results, start=1):
+        details = [f"{result['zone'].title()} zone"] if result["zone"] else []
+        if result["distance_km"] is not None:
+            details.append(f"{result['distance_km']} km away")
+        if result["al_range"]:
+            details.append(f"PSLE AL range {result['al_range']}")
+        if result["ccas"]:
+            details.append(f"CCAs: {', '.join(result['ccas'])}")
+        if result["programmes"]:
+            details.append(f"Programmes: {', '.join(result['programmes'])}")
+        lines.append(f"{rank}. {result['school_name']} ({'; '.join(details)})")
+    return "\n".join(lines)
@@ -0,0 +1,251 @@
+import csv
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from config import CACHE_DIR
+from resources import lazy_import
+from school_data import get_school_table, on_school_table_update
+from text_utils import char_ngrams, normalise_text
+
+# Profiles are built from the local copy of data.gov.sg collection 457 (see school_data.py)
+CHROMA_PATH = os.path.join(CACHE_DIR, "chroma")
+CHROMA_COLLECTION_NAME = "school_profiles_trigram"
+# Earlier collection embedded by Chroma's default model, which is downloaded on first use; dropped on open
+LEGACY_COLLECTION_NAMES = ("school_profiles",)
+# Size of the hashed word and trigram vectors profiles are embedded as
+EMBEDDING_DIMENSIONS = 1024
+SCHOOL_STORE_STATE_PATH = os.path.join(CACHE_DIR, "school_store.json")
+# Optional local file of PSLE cut-off ranges and affiliations, which data.gov.sg does not publish.
+# Columns: school_name, al_min, al_max, affiliations (separated by ";")
+SCHOOL_CUTOFFS_PATH = os.environ.get("SCHOOL_CUTOFFS_PATH", os.path.join(CACHE_DIR, "school_cutoffs.csv"))
+
+UPSERT_BATCH_SIZE = 100
+
+# Columns of the collection's datasets that are copied onto a school profile
+SINGLE_VALUE_FIELDS = {
+    "address": "address",
+    "postal_code": "postal_code",
+    "zone_code": "zone",
+    "dgp_code": "planning_area",
+    "mainlevel_code": "level",
+    "nature_code": "nature",
+    "type_code": "type",
+    "mrt_desc": "mrt",
+    "bus_desc": "bus",
+    "sap_ind": "sap",
+    "autonomous_ind": "autonomous",
+    "gifted_ind": "gifted",
+    "ip_ind": "integrated_programme",
+}
+MULTI_VALUE_FIELDS = {
+    "cca_generic_name": "ccas",
+    "subject_desc": "subjects",
+    "moe_programme_desc": "programmes",
+    "alp_domain": "programmes",
+    "llp_domain1": "programmes",
+}
+# Only schools offering secondary education are stored
+SECONDARY_LEVELS = {"SECONDARY", "MIXED LEVELS"}
+
+
+# Function to merge dataset records into one profile per school
+def build_school_profiles(records):
+    profiles = {}
+    for record in records:
+        name = (record.get("school_name") or "").strip()
+        if not name:
+            continue
+        profile = profiles.setdefault(normalise_text(name), {"school_name": name})
+        for column, field in SINGLE_VALUE_FIELDS.items():
+            if record.get(column) and record[column] != "na":
+                profile[field] = str(record[column]).strip()
+        for column, field in MULTI_VALUE_FIELDS.items():
+            value = (record.get(column) or "").strip()
+            if value and value.lower() != "na":
+                values = profile.setdefault(field, [])
+                if value not in values:
+                    values.append(value)
+
+    # Profiles only coming from CCA/subject lists have no level; keep them unless they are primary schools
+    return {
+        key: profile for key, profile in profiles.items()
+        if profile.get("level", "SECONDARY") in SECONDARY_LEVELS
+    }
+
+
+# Function to add PSLE cut-off ranges and affiliations from the optional local file
+def apply_cutoffs(profiles, path=SCHOOL_CUTOFFS_PATH):
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as cutoffs_file:
+            for row in csv.DictReader(cutoffs_file):
+                profile = profiles.get(normalise_text(row.get("school_name", "")))
+                if profile is None:
+                    continue
+                if row.get("al_min") and row.get("al_max"):
+                    profile["al_min"] = int(row["al_min"])
+                    profile["al_max"] = int(row["al_max"])
+                affiliations = [name.strip() for name in (row.get("affiliations") or "").split(";") if name.strip()]
+                if affiliations:
+                    profile["affiliations"] = affiliations
+    except OSError:
+        pass  # Cut-off ranges are optional
+    return profiles
+
+
+# Function to merge all datasets of the local school table into profiles
+def load_school_profiles(table=None):
+    table = table or get_school_table()
+    return apply_cutoffs(build_school_profiles(table.records()))
+
+
+# Function to render a profile as the text that is embedded and shown to the agents
+def profile_document(profile):
+    lines = [f"School: {profile['school_name']}"]
+    if profile.get("address"):
+        lines.append(f"Location: {profile['address']} (Singapore {profile.get('postal_code', '')}), "
+                     f"{profile.get('planning_area', '').title()}, {profile.get('zone', '').title()} zone")
+    if profile.get("al_min") is not None:
+        lines.append(f"PSLE AL cut-off range: {profile['al_min']}-{profile['al_max']}")
+    special = [label for field, label in [("sap", "SAP school"), ("autonomous", "Autonomous school"),
+                                          ("gifted", "Gifted Education Programme"),
+                                          ("integrated_programme", "Integrated Programme")]
+               if profile.get(field) == "Yes"]
+    if special:
+        lines.append(f"Status: {', '.join(special)}")
+    for field, label in [("programmes", "Programmes"), ("affiliations", "Affiliated schools"),
+                         ("ccas", "CCAs"), ("subjects", "Subjects")]:
+        if profile.get(field):
+            lines.append(f"{label}: {', '.join(profile[field])}")
+    if profile.get("mrt"):
+        lines.append(f"Nearest MRT: {profile['mrt']}")
+    return "\n".join(lines)
+
+
+# Function to write profiles into the Chroma collection in batches
+def upsert_profiles(collection, profiles, batch_size=UPSERT_BATCH_SIZE):
+    items = sorted(profiles.items())
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        collection.upsert(
+            ids=[key for key, _ in batch],
+            documents=[profile_document(profile) for _, profile in batch],
+            metadatas=[
+                {field: profile[field] for field in ("school_name", "zone", "postal_code", "al_min", "al_max")
+                 if profile.get(field) is not None}
+                for _, profile in batch
+            ],
+        )
+
+
+class TrigramEmbeddingFunction:
+    """Chroma embedding function hashing a text's words and character trigrams into a fixed-size vector.
+
+    Computed locally, so ingestion and retrieval work offline, unlike Chroma's
+    default model, which is downloaded on first use. Words and misspelt school
+    names still match on their shared trigrams.
+    """
+
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def __call__(self, input):
+        embeddings = []
+        for text in input:
+            normalised = normalise_text(text)
+            vector = np.zeros(self.dimensions, dtype=np.float32)
+            for feature in normalised.split() + sorted(char_ngrams(normalised)):
+                vector[zlib.crc32(feature.encode("utf-8")) % self.dimensions] += 1.0
+            norm = np.linalg.norm(vector)
+            embeddings.append(vector / norm if norm else vector)
+        return embeddings
+
+    def embed_query(self, input):
+        return self(input)
+
+    @staticmethod
+    def name():
+        return "school_finder_trigram"
+
+    def get_config(self):
+        return {"dimensions": self.dimensions}
+
+    @staticmethod
+    def build_from_config(config):
+        return TrigramEmbeddingFunction(**config)
+
+    def default_space(self):
+        return "cosine"
+
+    def supported_spaces(self):
+        return ["cosine", "l2", "ip"]
+
+    def is_legacy(self):
+        return False
+
+
+def get_chroma_client(path=CHROMA_PATH):
+    """Create the on-disk Chroma client; callers should hold on to it for the whole process."""
+    chromadb = lazy_import("chromadb")
+    os.makedirs(path, exist_ok=True)
+    return chromadb.PersistentClient(path=path)
+
+
+def get_school_collection(client):
+    existing = {collection.name for collection in client.list_collections()}
+    for legacy_name in existing.intersection(LEGACY_COLLECTION_NAMES):
+        client.delete_collection(legacy_name)
+    return client.get_or_create_collection(CHROMA_COLLECTION_NAME, embedding_function=TrigramEmbeddingFunction(),
+                                           metadata={"hnsw:space": "cosine"})
+
+
+def _ingested_at():
+    try:
+        with open(SCHOOL_STORE_STATE_PATH, "r", encoding="utf-8") as state_file:
+            return json.load(state_file).get("ingested_at", 0)
+    except (OSError, ValueError):
+        return 0
+
+
+_ingest_lock = threading.Lock()
+
+
+def ingest_school_profiles(collection, table=None):
+    """Upsert every profile from the school table, unless another thread already is."""
+    if not _ingest_lock.acquire(blocking=False):
+        return
+    try:
+        profiles = load_school_profiles(table)
+        if profiles:
+            upsert_profiles(collection, profiles)
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(SCHOOL_STORE_STATE_PATH, "w", encoding="utf-8") as state_file:
+                json.dump({"ingested_at": time.time(), "schools": len(profiles)}, state_file)
+    except Exception as e:
+        print(f"Error ingesting school profiles: {e}")
+    finally:
+        _ingest_lock.release()
+
+
+def warm_school_collection(collection):
+    """Start a background ingestion when the collection is empty or older than the school table,
+    and re-ingest whenever the table is refreshed."""
+    on_school_table_update(lambda table: ingest_school_profiles(collection, table))
+
+    def warm():
+        if collection.count() == 0 or _ingested_at() < get_school_table().synced_at:
+            ingest_school_profiles(collection)
+
+    threading.Thread(target=warm, daemon=True).start()
+
+
+def retrieve_school_context(collection, query, n_results=3):
+    """Return the school profiles most relevant to a query as one block of text."""
+    if collection.count() == 0:
+        return ""
+    results = collection.query(query_texts=[query], n_results=min(n_results, collection.count()))
+    return "\n\n".join(results.get("documents", [[]])[0])
@@ -0,0 +1,249 @@
+"""Shortlist reports: one student's profile checked against a list of schools in one go.
+
+Instead of a chat turn per school, the facts for every school on the list
+(PSLE cut-off fit, distance from home, matching CCAs and programmes, nearest
+MRT, bus services) are gathered locally in one vectorised pass over the school
+table, and each agent then answers for all the schools at once in a single
+structured (JSON) request. A report for six schools costs three model calls
+instead of a chat turn per school, so whole-class reports are practical.
+"""
+import json
+
+import openai
+
+import core
+from geo_index import get_geo_index
+from geocode import geocode
+from orchestration import DEFAULT_CALL_TIMEOUT, run_streams
+from school_query import ZONES, get_query_engine
+from text_utils import normalise_text
+from tracing import span, trace_turn
+from transport import lookup_transport
+
+MAX_SHORTLIST_SCHOOLS = 12
+# Completion tokens allowed per school in each agent's answer
+TOKENS_PER_SCHOOL = 80
+# Profile fields taken as given; anything else is read from the free-text "notes"
+PROFILE_FIELDS = ("al_score", "postal_code", "max_distance_km", "zones", "ccas", "programmes", "affiliations")
+
+# What each agent writes about every school on the list
+PERSONA_INSTRUCTIONS = {
+    "Student Councillor": "Summarise neutrally and factually how the school fits this student.",
+    "Angel": "Give the most encouraging reason the school could suit this student.",
+    "Devil": "Point out the main practical concern with the school for this student, such as the cut-off, "
+             "travel or a missing CCA, in Singlish.",
+}
+REPORT_FORMAT = ('Reply with JSON only, in the form {"schools": [{"school_name": "...", "rating": 1-5, '
+                 '"comment": "one sentence"}]}, with one entry per school in the order given, '
+                 "using the facts provided and nothing else.")
+
+
+class ShortlistError(ValueError):
+    """Raised when a shortlist request cannot be evaluated, e.g. no school on it is recognised."""
+
+
+# Function to read a list field given as a list of strings or as one comma-separated string
+def _text_list(field, value):
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+        raise ShortlistError(f"{field} must be a list of names or a comma-separated string.")
+    return [item.strip() for item in value if item.strip()]
+
+
+# Function to check one profile field and return it in the form the query engine expects
+def _profile_value(field, value):
+    if field == "al_score":
+        # JSON numbers may arrive as 14.0, e.g. from JavaScript clients
+        try:
+            score = float(value)
+        except (TypeError, ValueError):
+            score = 0.0
+        if isinstance(value, bool) or not score.is_integer() or not 4 <= score <= 32:
+            raise ShortlistError("al_score must be a PSLE AL score from 4 to 32.")
+        return int(score)
+    if field == "postal_code":
+        if isinstance(value, bool) or not str(value).strip().isdigit() or len(str(value).strip()) != 6:
+            raise ShortlistError("postal_code must be a 6-digit Singapore postal code.")
+        return str(value).strip()
+    if field == "max_distance_km":
+        try:
+            distance = float(value)
+        except (TypeError, ValueError):
+            distance = 0.0
+        if isinstance(value, bool) or not distance > 0:
+            raise ShortlistError("max_distance_km must be a positive number.")
+        return distance
+    values = _text_list(field, value)
+    if field == "zones":
+        values = [zone.lower() for zone in values]
+        unknown = [zone for zone in values if zone not in ZONES]
+        if unknown:
+            raise ShortlistError(f"Unknown zones {', '.join(unknown)}; use {', '.join(ZONES)}.")
+    return values
+
+
+def student_criteria(profile):
+    """Turn a student profile into query criteria; explicit fields win over ones found in "notes".
+
+    Raises ShortlistError for a field that is not in the expected form.
+    """
+    notes = profile.get("notes") or ""
+    if not isinstance(notes, str):
+        raise ShortlistError("notes must be text.")
+    criteria = get_query_engine().criteria_from_prompt(notes)
+    for field in PROFILE_FIELDS:
+        value = profile.get(field)
+        if value not in (None, "", [], ()):
+            value = _profile_value(field, value)
+            if value:
+                criteria[field] = value
+    return criteria
+
+
+# Function to map the names a student typed ("bedok view sec") to the names in the school table
+def resolve_school_names(school_names):
+    resolved = {}
+    for requested in school_names:
+        matches = lookup_transport(requested)
+        resolved[requested] = matches[0]["school_name"] if matches else requested
+    return resolved
+
+
+def gather_shortlist_facts(criteria, school_names):
+    """Return one row of facts per known school, in the order given, from a single pass over the table."""
+    with span("retrieval.shortlist", schools=len(school_names)) as current:
+        engine = get_query_engine()
+        home = geocode(criteria["postal_code"]) if criteria.get("postal_code") else None
+        rows = engine.compare(
+            school_names,
+            al_score=criteria.get("al_score"),
+            zones=criteria.get("zones", ()),
+            home=home,
+            max_distance_km=criteria.get("max_distance_km"),
+            ccas=criteria.get("ccas", ()),
+            programmes=criteria.get("programmes", ()),
+            affiliations=criteria.get("affiliations", ()),
+        )
+        geo = get_geo_index(engine)
+        for row in rows:
+            stations = geo.nearest_stations(row["school_name"], k=1)
+            row["nearest_mrt"] = f"{stations[0][0].title()} ({stations[0][1]:.1f} km)" if stations else None
+            transport = lookup_transport(row["school_name"])
+            row["bus_services"] = transport[0]["bus_desc"] if transport else None
+        current.set(results=len(rows))
+    return rows
+
+
+# Function to describe the student and the schools' facts for the agents, one JSON line per school
+def describe_shortlist(criteria, rows):
+    student = ", ".join(f"{field.replace('_', ' ')}: {value}" for field, value in sorted(criteria.items()))
+    schools = "\n".join(json.dumps({field: value for field, value in row.items() if value not in (None, [], "")})
+                        for row in rows)
+    return (f"Student profile: {student or 'not given'}.\n"
+            f"PSLE AL scores run from 4 (best) to 32; a school is eligible if its cut-off range admits the student's score. "
+            f"Score is a 0-1 match with the profile.\nSchools:\n{schools}")
+
+
+# Function to ask one agent about every school at once, returning {normalised school name: verdict}
+def ask_persona(agent_name, description, school_count, timeout=DEFAULT_CALL_TIMEOUT):
+    response_cache = core.get_cache()
+    cache_name = f"{agent_name} shortlist"
+    instruction = f"{PERSONA_INSTRUCTIONS[agent_name]} {REPORT_FORMAT}"
+    with span(f"llm.{agent_name}", model="gpt-4o", shortlist=True) as current:
+        # The facts are the cache context, so only an identical shortlist reuses an answer
+        content = response_cache.get(cache_name, description, instruction)
+        current.set(cache_hit=content is not None)
+        if content is None:
+            response = openai.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": f"You are {agent_name}. {core.agent_context_message} {instruction}"},
+                    {"role": "user", "content": description},
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=TOKENS_PER_SCHOOL * school_count + 50,
+                temperature=0.4,
+                timeout=timeout
+            )
+            core.record_usage(current, response.usage)
+            content = response.choices[0].message.content
+            verdicts = parse_verdicts(content)
+            # Only answers that parse are cached
+            response_cache.put(cache_name, description, instruction, content)
+            return verdicts
+    return parse_verdicts(content)
+
+
+# Function to read an agent's JSON answer, ignoring entries that are not in the requested form
+def parse_verdicts(content):
+    verdicts = {}
+    for entry in json.loads(content).get("schools", []):
+        if isinstance(entry, dict) and entry.get("school_name"):
+            rating = entry.get("rating")
+            verdicts[normalise_text(entry["school_name"])] = {
+                "rating": rating if isinstance(rating, int) and 1 <= rating <= 5 else None,
+                "comment": str(entry.get("comment") or ""),
+            }
+    return verdicts
+
+
+def build_shortlist_report(profile, school_names):
+    """Evaluate a student's shortlist; returns {"criteria", "schools", "unmatched", "trace"}.
+
+    Each school row holds the local facts plus a rating (1-5) and comment from
+    every agent, e.g. row["Angel"] == {"rating": 4, "comment": "..."}.
+    """
+    school_names = list(dict.fromkeys(name.strip() for name in school_names if name and name.strip()))
+    if not school_names:
+        raise ShortlistError("List at least one school.")
+    if len(school_names) > MAX_SHORTLIST_SCHOOLS:
+        raise ShortlistError(f"A shortlist can have at most {MAX_SHORTLIST_SCHOOLS} schools.")
+
+    # Traced like a chat turn, so the report's stages show up in the trace log and metrics
+    with trace_turn(f"Shortlist of {len(school_names)} schools") as trace:
+        criteria = student_criteria(profile or {})
+        resolved = resolve_school_names(school_names)
+        rows = gather_shortlist_facts(criteria, list(resolved.values()))
+        found = {normalise_text(row["school_name"]) for row in rows}
+        unmatched = [requested for requested, name in resolved.items() if normalise_text(name) not in found]
+        if not rows:
+            raise ShortlistError(f"None of these schools were recognised: {', '.join(unmatched)}")
+
+        # One structured request per agent, all at once
+        description = describe_shortlist(criteria, rows)
+        timeout = core.settings["generation_timeout_seconds"]
+        jobs = {
+            agent_name: (lambda agent_name=agent_name: [ask_persona(agent_name, description, len(rows), timeout)])
+            for agent_name in PERSONA_INSTRUCTIONS
+        }
+        verdicts = {agent_name: {} for agent_name in PERSONA_INSTRUCTIONS}
+        for agent_name, kind, value in run_streams(jobs, max_concurrency=len(jobs), timeout=timeout):
+            if kind == "chunk":
+                verdicts[agent_name] = value
+            elif kind == "error":
+                print(f"Error with OpenAI API for {agent_name} shortlist: {value}")
+
+    for row in rows:
+        for agent_name, by_school in verdicts.items():
+            row[agent_name] = by_school.get(normalise_text(row["school_name"]),
+                                            {"rating": None, "comment": "No verdict available."})
+    return {"criteria": criteria, "schools": rows, "unmatched": unmatched, "trace": trace.to_dict()}
+
+
+# Function to flatten a report into table rows for display or CSV export
+def report_table(report):
+    return [
+        {
+            "School": row["school_name"].title(),
+            "Eligible": row["eligible"],
+            "Match": row["score"],
+            "PSLE AL range": row["al_range"],
+            "Distance (km)": row["distance_km"],
+            "Nearest MRT": row["nearest_mrt"],
+            "Matching CCAs": ", ".join(row["ccas"]),
+            **{f"{agent_name} rating": row[agent_name]["rating"] for agent_name in PERSONA_INSTRUCTIONS},
+            **{agent_name: row[agent_name]["comment"] for agent_name in PERSONA_INSTRUCTIONS},
+        }
+        for row in report["schools"]
+    ]
@@ -0,0 +1,36 @@
+import pytest
+import requests
+
+from http_client import CircuitBreaker, HttpClient
+
+
+# Function to make a client whose breaker is already half-open, with every GET raising the given error
+def half_open_client(error):
+    breaker = CircuitBreaker(threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    client = HttpClient("test", retries=0, breaker=breaker, sleep=lambda seconds: None)
+
+    def failing_get(*args, **kwargs):
+        raise error
+
+    client.session.get = failing_get
+    client.session.post = failing_get
+    return client
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.ChunkedEncodingError("truncated"), ValueError("bad reply")])
+def test_failed_trial_get_lets_the_next_trial_through(error):
+    client = half_open_client(error)
+    with pytest.raises(type(error)):
+        client.get("http://upstream.test/")
+    assert not client.breaker._trial_running
+    assert client.breaker.allow()
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.ChunkedEncodingError("truncated"), ValueError("bad reply")])
+def test_failed_trial_post_lets_the_next_trial_through(error):
+    client = half_open_client(error)
+    with pytest.raises(type(error)):
+        client.post_json("http://upstream.test/", {})
+    assert not client.breaker._trial_running
+    assert client.breaker.allow()
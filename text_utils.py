@@ -0,0 +1,119 @@
+import re
+from collections import deque
+
+# Words that carry no meaning when matching school names against each other
+SCHOOL_NAME_STOPWORDS = {"school", "secondary", "sec", "the", "and"}
+
+
+# Function to normalise free text (school names, prompts) into a comparable form
+def normalise_text(text):
+    text = (text or "").lower()
+    text = text.replace("&", " and ")
+    text = re.sub(r"[’'`]", "", text)
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return " ".join(text.split())
+
+
+# Function to build the set of character n-grams of a normalised string
+def char_ngrams(text, n=3):
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+# Function to derive short names a student might type for a school
+def school_name_aliases(normalised_name):
+    aliases = set()
+    words = normalised_name.split()
+    if not words:
+        return aliases
+
+    # Acronym of every word, e.g. "hwa chong institution" -> "hci"
+    if len(words) > 1:
+        aliases.add("".join(word[0] for word in words))
+
+    # Acronyms and short forms with trailing qualifiers dropped one at a time,
+    # e.g. "raffles girls school secondary" -> "rgs", "raffles girls"
+    core_words = list(words)
+    while len(core_words) > 1 and core_words[-1] in SCHOOL_NAME_STOPWORDS:
+        core_words.pop()
+        aliases.add(" ".join(core_words))
+        if len(core_words) > 1:
+            aliases.add("".join(word[0] for word in core_words))
+
+    # Short form with generic words removed, e.g. "bedok view"
+    meaningful_words = [word for word in words if word not in SCHOOL_NAME_STOPWORDS]
+    if meaningful_words and meaningful_words != words:
+        aliases.add(" ".join(meaningful_words))
+
+    aliases.discard(normalised_name)
+    # Very short acronyms ("s", "ns") collide too easily to be useful
+    return {alias for alias in aliases if len(alias) >= 2}
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton finding every occurrence of many phrases in one pass over a text.
+
+    Phrases and texts are normalised with normalise_text. Phrases match whole
+    words; prefixes match at the start of a word, so "program" finds "programmes".
+    Each phrase carries a value (a label, a school's position) returned with its matches.
+    """
+
+    def __init__(self, phrases=(), prefixes=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for items, closing in [(phrases, " "), (prefixes, "")]:
+            for phrase, value in items:
+                normalised = normalise_text(phrase)
+                if normalised:
+                    self._add(f" {normalised}{closing}", normalised, value)
+        self._link()
+
+    def _add(self, pattern, phrase, value):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append((len(pattern), phrase, value))
+
+    # Breadth-first pass setting each state's failure link to its longest proper suffix in the trie
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[following] = self._goto[fail].get(char, 0) if state else 0
+                self._output[following] = self._output[following] + self._output[self._fail[following]]
+
+    def find(self, normalised_text):
+        """Return (start, phrase, value) for every match in already normalised text, in order of start."""
+        found = []
+        state = 0
+        for position, char in enumerate(f" {normalised_text} "):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, phrase, value in self._output[state]:
+                # The pattern's leading space sits just before the phrase in the normalised text
+                found.append((position - length + 1, phrase, value))
+        return sorted(found, key=lambda match: match[0])
+
+    def find_longest(self, normalised_text):
+        """Like find(), but where matches overlap keep only the leftmost, longest one."""
+        kept = []
+        end = 0
+        for start, phrase, value in sorted(self.find(normalised_text), key=lambda match: (match[0], -len(match[1]))):
+            if start >= end:
+                kept.append((start, phrase, value))
+                end = start + len(phrase)
+        return kept
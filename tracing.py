@@ -0,0 +1,188 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from config import CACHE_DIR, atomic_write
+
+TRACE_LOG_PATH = os.path.join(CACHE_DIR, "traces.jsonl")
+METRICS_PATH = os.path.join(CACHE_DIR, "metrics.prom")
+# Set SCHOOL_FINDER_TRACE_EXPORT=1 to also write traces and metrics to the cache directory
+TRACE_EXPORT = os.environ.get("SCHOOL_FINDER_TRACE_EXPORT", "0") == "1"
+# The trace log is rotated to traces.jsonl.1 once it grows past this size, so at most twice this is kept
+TRACE_LOG_MAX_BYTES = int(os.environ.get("SCHOOL_FINDER_TRACE_LOG_MAX_BYTES", 10 * 1024 * 1024))
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage of a turn, e.g. routing, retrieval, an agent completion or an HTTP call."""
+
+    def __init__(self, name, parent=None, **attributes):
+        self.span_id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes)
+        self.started = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started": self.started,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 2),
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class Trace:
+    """All spans recorded while answering one user message."""
+
+    def __init__(self, prompt):
+        self.trace_id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.started = time.time()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {
+            "trace_id": self.trace_id,
+            "started": self.started,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 2),
+            "prompt_chars": len(self.prompt),
+            "spans": spans,
+        }
+
+
+class Metrics:
+    """Process-wide aggregates of every span, exported in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(lambda: [0.0, 0])
+        self.errors = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.tokens = defaultdict(int)
+
+    def record(self, span):
+        with self._lock:
+            total = self.durations[span.name]
+            total[0] += span.duration or 0.0
+            total[1] += 1
+            if span.error:
+                self.errors[(span.name, span.error)] += 1
+            if span.attributes.get("cache_hit"):
+                self.cache_hits[span.name] += 1
+            for kind in ("prompt_tokens", "completion_tokens"):
+                if span.attributes.get(kind):
+                    self.tokens[(span.name, kind)] += span.attributes[kind]
+
+    def to_prometheus(self):
+        with self._lock:
+            lines = [
+                "# HELP school_finder_span_seconds Time spent in each stage of a turn.",
+                "# TYPE school_finder_span_seconds summary",
+            ]
+            for name, (seconds, count) in sorted(self.durations.items()):
+                lines.append(f'school_finder_span_seconds_sum{{span="{name}"}} {seconds:.6f}')
+                lines.append(f'school_finder_span_seconds_count{{span="{name}"}} {count}')
+            lines += ["# HELP school_finder_span_errors_total Failed stages by error class.",
+                      "# TYPE school_finder_span_errors_total counter"]
+            for (name, error), count in sorted(self.errors.items()):
+                lines.append(f'school_finder_span_errors_total{{span="{name}",error="{error}"}} {count}')
+            lines += ["# HELP school_finder_cache_hits_total Stages answered from a cache.",
+                      "# TYPE school_finder_cache_hits_total counter"]
+            for name, count in sorted(self.cache_hits.items()):
+                lines.append(f'school_finder_cache_hits_total{{span="{name}"}} {count}')
+            lines += ["# HELP school_finder_tokens_total OpenAI tokens used.",
+                      "# TYPE school_finder_tokens_total counter"]
+            for (name, kind), count in sorted(self.tokens.items()):
+                lines.append(f'school_finder_tokens_total{{span="{name}",kind="{kind.replace("_tokens", "")}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_export_lock = threading.Lock()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage of the current turn; spans outside a turn still count towards the metrics."""
+    current = Span(name, parent=_current_span.get(), **attributes)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            pass  # A streaming generator closed from another context, e.g. after a timeout
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+        metrics.record(current)
+
+
+def current_span():
+    """Return the innermost open span, so helpers can attach attributes to it."""
+    return _current_span.get()
+
+
+@contextmanager
+def trace_turn(prompt):
+    """Collect every span recorded while answering one message, then export the trace."""
+    trace = Trace(prompt)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - started
+        try:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+        except ValueError:
+            pass  # A turn generator closed from another context, e.g. after the client went away
+        if TRACE_EXPORT:
+            export_trace(trace)
+
+
+def export_trace(trace):
+    """Append the trace to the JSON lines log and rewrite the Prometheus metrics file."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with _export_lock:
+            if os.path.exists(TRACE_LOG_PATH) and os.path.getsize(TRACE_LOG_PATH) >= TRACE_LOG_MAX_BYTES:
+                os.replace(TRACE_LOG_PATH, f"{TRACE_LOG_PATH}.1")
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as trace_log:
+                trace_log.write(json.dumps(trace.to_dict()) + "\n")
+            # The metrics are this process's; one process per cache directory, see api.py
+            atomic_write(METRICS_PATH, lambda metrics_file: metrics_file.write(metrics.to_prometheus()))
+    except OSError as e:
+        print(f"Error exporting trace: {e}")
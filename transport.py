@@ -0,0 +1,146 @@
+import threading
+from collections import Counter
+from functools import lru_cache
+
+from fuzzywuzzy import fuzz  # Import for partial string matching
+
+from school_data import get_school_table, on_school_table_update
+from text_utils import PhraseMatcher, char_ngrams, normalise_text, school_name_aliases
+
+# Bus and MRT descriptions come from the "General information of schools" dataset
+# in the local school table (see school_data.py), which is synced from data.gov.sg.
+
+# Fuzzy matching settings
+MATCH_THRESHOLD = 80
+MAX_FUZZY_CANDIDATES = 25
+
+
+class TransportIndex:
+    """In-memory index of school transport records keyed on normalised school names."""
+
+    def __init__(self, records):
+        self.records = []
+        self.names = []
+        self.by_name = {}
+        self.aliases = {}
+        self.ngram_postings = {}
+
+        for record in records:
+            name = normalise_text(record.get("school_name", ""))
+            if not name or name in self.by_name:
+                continue
+            position = len(self.records)
+            self.records.append({
+                "school_name": record.get("school_name", ""),
+                "bus_desc": record.get("bus_desc") or "No specific bus info",
+                "mrt_desc": record.get("mrt_desc") or "No specific MRT info",
+            })
+            self.names.append(name)
+            self.by_name[name] = position
+            for alias in school_name_aliases(name):
+                self.aliases.setdefault(alias, []).append(position)
+            for gram in char_ngrams(name):
+                self.ngram_postings.setdefault(gram, []).append(position)
+
+        # Full names, plus aliases that name one school and are long enough not to be ordinary words
+        # in a sentence ("ri", "bv"), found in a prompt in one pass
+        self.matcher = PhraseMatcher(
+            [(name, position) for name, position in self.by_name.items()]
+            + [(alias, positions[0]) for alias, positions in self.aliases.items()
+               if len(alias) >= 3 and len(positions) == 1]
+        )
+
+    def __len__(self):
+        return len(self.records)
+
+    # Function to shortlist records sharing the most n-grams with the query
+    def _candidates(self, query):
+        overlap = Counter()
+        for gram in char_ngrams(query):
+            for position in self.ngram_postings.get(gram, ()):
+                overlap[position] += 1
+        return [position for position, _ in overlap.most_common(MAX_FUZZY_CANDIDATES)]
+
+    # Function to find each school named in normalised text once, with where it is first named
+    def _first_mentions(self, normalised_text):
+        first = {}
+        # "bedok view secondary" is one school, not also "bedok" for another
+        for start, _, position in self.matcher.find_longest(normalised_text):
+            first.setdefault(position, start)
+        return first
+
+    def locate(self, normalised_text):
+        """Return (start, school_name) for every school named in normalised text, in order of appearance."""
+        first = self._first_mentions(normalised_text)
+        return [(start, self.records[position]["school_name"])
+                for position, start in sorted(first.items(), key=lambda item: (item[1], item[0]))]
+
+    def mentions(self, text):
+        """Return the names of schools mentioned in free text by full name or alias."""
+        return [self.records[position]["school_name"] for position in sorted(self._first_mentions(normalise_text(text)))]
+
+    def lookup(self, school_name):
+        """Return the transport records matching a school name, best match first."""
+        query = normalise_text(school_name)
+        if not query:
+            return []
+
+        if query in self.by_name:
+            return [self.records[self.by_name[query]]]
+        if query in self.aliases:
+            return [self.records[position] for position in self.aliases[query]]
+
+        scored = []
+        for position in self._candidates(query):
+            score = fuzz.partial_ratio(query, self.names[position])
+            if score > MATCH_THRESHOLD:
+                scored.append((-score, self.names[position], position))
+        return [self.records[position] for _, _, position in sorted(scored)]
+
+
+_index_lock = threading.Lock()
+_index = None
+
+
+# Function to rebuild the index whenever the school table is refreshed
+def _rebuild_index(table):
+    global _index
+    general_information = table.find("bus_desc")
+    index = TransportIndex(general_information.records() if general_information is not None else [])
+    with _index_lock:
+        _index = index
+        _cached_lookup.cache_clear()
+
+
+on_school_table_update(_rebuild_index)
+
+
+def get_transport_index():
+    """Return the process-wide transport index built from the local school table."""
+    table = get_school_table()
+    with _index_lock:
+        if _index is not None:
+            return _index
+    _rebuild_index(table)
+    return _index
+
+
+@lru_cache(maxsize=1024)
+def _cached_lookup(normalised_name):
+    return tuple(_index.lookup(normalised_name))
+
+
+def find_school_mentions(text):
+    """Return the names of schools mentioned in a prompt."""
+    return get_transport_index().mentions(text)
+
+
+def locate_school_mentions(normalised_text):
+    """Return (start, school_name) for the schools named in an already normalised prompt."""
+    return get_transport_index().locate(normalised_text)
+
+
+def lookup_transport(school_name):
+    """Return transport records for a school name without any network I/O once loaded."""
+    get_transport_index()
+    return list(_cached_lookup(normalise_text(school_name)))